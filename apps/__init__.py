@@ -7,6 +7,9 @@
 @file: __init__.py
 @time: 2019/10/11 21:26
 """
+import atexit
+import time
+
 from flask import Flask
 from flask_bootstrap import Bootstrap
 
@@ -24,9 +27,143 @@ def register_db(app):
     pass
 
 
+# LTP模型池初始化, 模型在进程内只加载一次
+def register_ltp(app):
+    from apps.nlp.ltp_pool import LTPManagerPool
+    from apps.nlp.parse_news import LTPManager
+    # 基准测试可以通过create_app(config)换成不需要模型文件的LTP后端
+    pool = LTPManagerPool(app.config['LTP_MODEL_PATH'],
+                          size=app.config['LTP_POOL_SIZE'],
+                          timeout=app.config['LTP_POOL_TIMEOUT'],
+                          manager_factory=app.config.get('LTP_MANAGER_FACTORY', LTPManager))
+    pool.load()
+    app.extensions['ltp_pool'] = pool
+    atexit.register(pool.release)  # 进程退出时释放模型
+    # 抽取默认用取到的LTP模型分词, 配置为其他后端时进程内共享一个
+    segmenter = None
+    if app.config['EXTRACT_SEGMENTER'] != 'ltp':
+        from apps.nlp.segment import get_segmenter
+        segmenter = get_segmenter(app.config['EXTRACT_SEGMENTER'])
+    app.extensions['segmenter'] = segmenter
+
+    return None
+
+
+# 语料级tf-idf模型, 启动时加载一次
+def register_tfidf(app):
+    from apps.nlp.tfidf import load_tfidf_model
+    app.extensions['tfidf_model'] = load_tfidf_model(app.config['TFIDF_MODEL_PATH'])
+
+    return None
+
+
+# 句子标注和整篇抽取结果的缓存
+def register_cache(app):
+    from apps.nlp.cache import ExtractionCache
+    app.extensions['extraction_cache'] = ExtractionCache(app.config['SENTENCE_CACHE_SIZE'],
+                                                         app.config['DOCUMENT_CACHE_SIZE'],
+                                                         app.config['CACHE_TTL'])
+
+    return None
+
+
+# 词表在启动时加载, 之后由后台线程检查文件修改
+def register_lexicons(app):
+    from apps.utils.lexicon import lexicons
+    lexicons.get(app.config['SYNONYMS_PATH'])
+    lexicons.get(app.config['DEFAULT_STOPWORDS_PATH'])
+    if app.config['LEXICON_RELOAD_INTERVAL'] > 0:
+        lexicons.start_watcher(app.config['LEXICON_RELOAD_INTERVAL'])
+    app.extensions['lexicons'] = lexicons
+
+    return None
+
+
+# 长文本异步抽取任务, 工作线程使用各自的LTP模型
+def register_jobs(app):
+    if app.config['JOB_WORKERS'] <= 0:
+        return None
+    from apps.nlp.jobs import JobManager
+    from apps.nlp.parse_news import LTPManager
+    jobs = JobManager(app.config['LTP_MODEL_PATH'], app.config['SYNONYMS_PATH'],
+                      workers=app.config['JOB_WORKERS'],
+                      queue_size=app.config['JOB_QUEUE_SIZE'],
+                      result_ttl=app.config['JOB_RESULT_TTL'],
+                      tfidf_model=app.extensions['tfidf_model'],
+                      cache=app.extensions['extraction_cache'],
+                      segmenter=app.extensions['segmenter'],
+                      manager_factory=app.config.get('LTP_MANAGER_FACTORY', LTPManager))
+    app.extensions['jobs'] = jobs.start()
+    atexit.register(jobs.stop, 5)
+
+    return None
+
+
+# 言论库, 每个线程使用自己的SQLite连接
+def register_quotes(app):
+    from apps.nlp.quote_store import QuoteStore
+    app.extensions['quote_store'] = QuoteStore(app.config['QUOTE_STORE_PATH'])
+
+    return None
+
+
+# 请求耗时统计和采样
+def register_metrics(app):
+    from flask import g, request
+    from apps.utils.metrics import metrics
+    metrics.configure(app.config['METRICS_TRACE_SAMPLE_RATE'], app.config['METRICS_TRACE_KEEP'])
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        metrics.start_trace('{} {}'.format(request.method, request.path))
+
+    # 在响应关闭时结束计时, 流式响应也统计到最后一行发送完
+    @app.after_request
+    def stop_timer(response):
+        start = g.pop('request_start', None)
+        endpoint = request.endpoint or 'unknown'
+
+        def finish():
+            if start is not None:
+                metrics.observe_request(endpoint, time.perf_counter() - start)
+            metrics.finish_trace()
+
+        response.call_on_close(finish)
+        return response
+
+    app.extensions['metrics'] = metrics
+
+    return None
+
+
 # 产生主app对象
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
+    app.config.from_object('apps.config')
+    if config:
+        app.config.update(config)
+
+    # 词表注册
+    register_lexicons(app)
+
+    # LTP模型池注册
+    register_ltp(app)
+
+    # tf-idf模型注册
+    register_tfidf(app)
+
+    # 缓存注册
+    register_cache(app)
+
+    # 异步任务注册
+    register_jobs(app)
+
+    # 言论库注册
+    register_quotes(app)
+
+    # 耗时统计注册
+    register_metrics(app)
 
     # 数据库对象注册
     register_db(app)
@@ -17,6 +17,62 @@ SYNONYMS_PATH = os.path.join(base_path, 'dataset/synonyms/synonyms.txt')
 DEFAULT_STOPWORDS_PATH = os.path.join(base_path, 'dataset/stop_words/stopwords.txt')
 DEFAULT_SYNONYMS_PATH = os.path.join(base_path, 'dataset/synonyms/synonyms.txt')
 WORD2VEC_MODEL_PATH = os.path.join(base_path, 'dataset/word2vec.wv')
+WORD2VEC_FULL_MODEL_PATH = os.path.join(base_path, 'dataset/word2vec.model')  # 完整模型, 用于继续训练
+WORD2VEC_STATE_PATH = os.path.join(base_path, 'dataset/word2vec.state.json')  # 已训练过的语料分片
+PRELOAD_WORD_VECTORS = os.environ.get('PRELOAD_WORD_VECTORS', '0') == '1'  # gunicorn主进程fork前预加载词向量, 网页服务本身不用词向量
 WIKI_DATA_PATH = os.path.join(base_path, 'dataset/wiki_data/wiki_00')
+WIKI_DUMP_PATH = os.path.join(base_path, 'dataset/wiki_data/zhwiki-20190720-pages-articles-multistream.xml.bz2')
+WIKI_INDEX_PATH = os.path.join(base_path, 'dataset/wiki_data/zhwiki-20190720-pages-articles-multistream-index.txt.bz2')
 NEWS_DATA_PATH = os.path.join(base_path, 'dataset/news_data/news_chinese.csv')
-PROCESSED_DATA_PATH = os.path.join(base_path, 'dataset/processed/')
\ No newline at end of file
+PROCESSED_DATA_PATH = os.path.join(base_path, 'dataset/processed/')
+
+# LTP模型池
+LTP_POOL_SIZE = int(os.environ.get('LTP_POOL_SIZE', 2))  # 启动时加载的LTPManager个数
+LTP_POOL_TIMEOUT = float(os.environ.get('LTP_POOL_TIMEOUT', 10))  # 请求等待空闲模型的最长时间(秒)
+
+# 批量抽取接口
+API_MAX_DOCUMENTS = int(os.environ.get('API_MAX_DOCUMENTS', 5000))  # 单次请求最多的新闻篇数
+API_BATCH_SIZE = int(os.environ.get('API_BATCH_SIZE', 32))  # 一起标注的新闻篇数
+
+# 语料级tf-idf模型
+TFIDF_MODEL_PATH = os.path.join(base_path, 'dataset/tfidf.pkl')
+
+# 标注结果缓存
+SENTENCE_CACHE_SIZE = int(os.environ.get('SENTENCE_CACHE_SIZE', 200000))  # 缓存的句子标注条数
+DOCUMENT_CACHE_SIZE = int(os.environ.get('DOCUMENT_CACHE_SIZE', 20000))  # 缓存的整篇抽取结果条数
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 24 * 3600))  # 缓存有效期(秒)
+
+# 语料预处理
+PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', os.cpu_count() or 1))  # 预处理进程数
+PREPROCESS_CHUNK_SIZE = int(os.environ.get('PREPROCESS_CHUNK_SIZE', 2000))  # 每个任务的行数
+PREPROCESS_BINARY = bool(int(os.environ.get('PREPROCESS_BINARY', 0)))  # 1: 输出词表+词id数组, 0: 输出空格分隔的文本
+PREPROCESS_SHARD_SIZE = int(os.environ.get('PREPROCESS_SHARD_SIZE', 20000))  # 增量预处理每个分片的行数
+PREPROCESS_MANIFEST_PATH = os.path.join(PROCESSED_DATA_PATH, 'manifest.json')  # 已处理分片的内容哈希
+PREPROCESS_DEDUP = bool(int(os.environ.get('PREPROCESS_DEDUP', 1)))  # 新闻语料分词前去掉近似重复(转载)的文本
+PREPROCESS_DEDUP_THRESHOLD = float(os.environ.get('PREPROCESS_DEDUP_THRESHOLD', 0.8))  # 估计的Jaccard相似度阈值
+PREPROCESS_DEDUP_WINDOW = int(os.environ.get('PREPROCESS_DEDUP_WINDOW', 100000))  # 去重索引保留的文本数, 每篇约2KB内存
+
+# 冷启动
+JIEBA_CACHE_PATH = os.path.join(base_path, 'dataset/jieba.cache')  # 部署时预先生成的jieba前缀词典缓存
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', 5))  # 启动到第一个请求的时间预算
+
+# 词表热更新
+LEXICON_RELOAD_INTERVAL = float(os.environ.get('LEXICON_RELOAD_INTERVAL', 5))  # 检查词表文件修改的间隔(秒), 0表示不检查
+
+# 耗时统计
+METRICS_TRACE_SAMPLE_RATE = float(os.environ.get('METRICS_TRACE_SAMPLE_RATE', 0.01))  # 记录完整耗时的请求比例
+METRICS_TRACE_KEEP = int(os.environ.get('METRICS_TRACE_KEEP', 100))  # 保留最近多少条采样记录
+
+# 长文本异步抽取任务
+# 任务只保存在所在进程的内存里, 启用时该进程必须单独部署为一个gunicorn worker, 否则查询可能落到其他进程返回404
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 0))  # 工作线程数, 每个线程加载一份LTP模型, 0表示不启用
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 100))  # 最多排队的任务数, 超过时返回429
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', 3600))  # 任务结束后结果保留的时间(秒)
+JOB_MAX_CHARS = int(os.environ.get('JOB_MAX_CHARS', 200000))  # 单个任务的最大字符数
+
+# 分词后端, 'jieba' 或 'ltp'
+PREPROCESS_SEGMENTER = os.environ.get('PREPROCESS_SEGMENTER', 'jieba')  # 训练语料预处理
+EXTRACT_SEGMENTER = os.environ.get('EXTRACT_SEGMENTER', 'ltp')  # 在线言论抽取, 'ltp'时使用请求取到的同一个模型
+
+# 言论库
+QUOTE_STORE_PATH = os.path.join(base_path, 'dataset/quotes.db')
@@ -0,0 +1,240 @@
+"""
+词向量的近似最近邻索引 (IVF)
+用球面k-means把单位化后的词向量分成nlist个簇, 查询时只扫描与查询最接近的nprobe个簇,
+nprobe越大召回率越高、速度越慢
+索引保存在 .wv 文件旁边的文件夹里, 加载时以只读方式内存映射
+"""
+import os
+import shutil
+import time
+
+import numpy as np
+
+from apps.config import WORD2VEC_MODEL_PATH
+from apps.utils import clock
+
+INDEX_FILES = ('centroids', 'vectors', 'ids', 'offsets')
+
+
+def index_dir(wv_path):
+    return wv_path + '.ivf'
+
+
+def index_exists(wv_path):
+    return os.path.exists(os.path.join(index_dir(wv_path), INDEX_FILES[0] + '.npy'))
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def assign(vectors, centroids, block_size=65536):
+    """
+    分块求每个向量最近的簇
+    :return:
+    """
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for begin in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[begin:begin + block_size], dtype=np.float32)
+        labels[begin:begin + block_size] = np.argmax(np.dot(block, centroids.T), axis=1)
+    return labels
+
+
+def train_centroids(vectors, nlist, n_iter=10, sample_size=None, seed=0):
+    """
+    球面k-means, 在采样上训练簇中心
+    :param vectors: 单位化后的向量
+    :param nlist: 簇的个数
+    :param n_iter: 迭代次数
+    :param sample_size: 训练样本数, 默认 64 * nlist
+    :param seed:
+    :return:
+    """
+    rng = np.random.RandomState(seed)
+    nlist = min(nlist, len(vectors))  # 词表比簇数还小时每个词一个簇
+    sample_size = min(len(vectors), sample_size or 64 * nlist)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = np.bincount(labels, minlength=nlist) == 0
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]  # 空簇重新随机初始化
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex(object):
+    """
+    倒排文件索引: 同一簇的向量在磁盘上连续存放
+    """
+
+    def __init__(self, centroids, vectors, ids, offsets, words=None):
+        self.centroids = centroids  # (nlist, d)
+        self.vectors = vectors  # (n, d) 按簇排好序的单位向量
+        self.ids = ids  # (n,) 排序后每行对应的原词下标
+        self.offsets = offsets  # (nlist + 1,) 每个簇在vectors中的起止位置
+        self.words = words  # 下标 -> 词
+        self.index = {w: i for i, w in enumerate(words)} if words is not None else None
+        self._positions = None
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    @clock
+    def build(cls, vectors, nlist=None, n_iter=10, words=None):
+        """
+        :param vectors: 原始词向量 (n, d)
+        :param nlist: 簇的个数, 默认 4 * sqrt(n)
+        :return:
+        """
+        nlist = min(nlist or max(1, int(4 * np.sqrt(len(vectors)))), len(vectors))
+        normed = normalize(np.asarray(vectors))
+        centroids = train_centroids(normed, nlist, n_iter)
+        labels = assign(normed, centroids)
+        ids = np.argsort(labels, kind='stable').astype(np.int32)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        return cls(centroids, normed[ids], ids, offsets, words)
+
+    def save(self, path):
+        """
+        先写入临时文件夹, 再整体替换, 中途中断不会留下新旧混杂的索引文件
+        :param path: 索引文件夹
+        :return:
+        """
+        path = path.rstrip('/\\')
+        tmp_dir, old_dir = path + '.tmp', path + '.old'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in INDEX_FILES:
+            np.save(os.path.join(tmp_dir, name + '.npy'), getattr(self, name))
+        if os.path.exists(path):
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.replace(path, old_dir)
+        os.replace(tmp_dir, path)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, words=None, mmap_mode='r'):
+        arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in INDEX_FILES]
+        return cls(*arrays, words=words)
+
+    def search(self, query, topn=10, nprobe=8, exclude=None):
+        """
+        :param query: 查询向量 (d,)
+        :param topn:
+        :param nprobe: 扫描的簇数
+        :param exclude: 需要排除的原词下标(通常是查询词自身)
+        :return: [(原词下标, 相似度), ...] 按相似度降序
+        """
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        nprobe = min(nprobe, self.nlist)
+        probe = np.argpartition(-np.dot(self.centroids, query), nprobe - 1)[:nprobe]
+        ranges = [(self.offsets[c], self.offsets[c + 1]) for c in probe]
+        rows = np.concatenate([np.arange(s, e) for s, e in ranges]) if ranges else np.zeros(0, dtype=np.int64)
+        if not len(rows):
+            return []
+        scores = np.concatenate([np.dot(self.vectors[s:e], query) for s, e in ranges])
+        ids = self.ids[rows]
+        if exclude is not None:
+            scores[ids == exclude] = -np.inf
+        k = min(topn, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((ids[top], -scores[top]))]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > -np.inf]
+
+    @property
+    def positions(self):
+        """
+        原词下标 -> 在vectors中的行号
+        """
+        if self._positions is None:
+            positions = np.empty(len(self.ids), dtype=np.int64)
+            positions[self.ids] = np.arange(len(self.ids))
+            self._positions = positions
+        return self._positions
+
+    def most_similar(self, word, topn=10, nprobe=8):
+        """
+        与 KeyedVectors.most_similar 相同的返回格式
+        :param word:
+        :param topn:
+        :param nprobe:
+        :return: [(词, 相似度), ...]
+        """
+        i = self.index[word]
+        query = self.vectors[self.positions[i]]
+        return [(self.words[j], s) for j, s in self.search(query, topn, nprobe, exclude=i)]
+
+
+def model_words(model):
+    # gensim 4 改名为 index_to_key
+    return list(getattr(model, 'index_to_key', None) or model.index2word)
+
+
+def build_ann_index(model, wv_path=WORD2VEC_MODEL_PATH, nlist=None):
+    """
+    离线构建索引并保存在 .wv 文件旁边
+    :param model: KeyedVectors
+    :param wv_path:
+    :param nlist:
+    :return:
+    """
+    index = IVFIndex.build(model.vectors, nlist=nlist, words=model_words(model))
+    index.save(index_dir(wv_path))
+    return index
+
+
+def load_ann_index(model, wv_path=WORD2VEC_MODEL_PATH):
+    """
+    内存映射加载索引, 索引不存在时返回None
+    :param model: 提供词表的KeyedVectors
+    :param wv_path:
+    :return:
+    """
+    if not index_exists(wv_path):
+        return None
+    return IVFIndex.load(index_dir(wv_path), words=model_words(model))
+
+
+def benchmark(model, index, n_queries=200, topn=10, nprobes=(1, 4, 8, 16, 32), seed=0):
+    """
+    对比精确 most_similar 的 recall@topn 和每秒查询数
+    :param model: KeyedVectors
+    :param index: IVFIndex
+    :return: [{'method': ..., 'nprobe': ..., 'recall': ..., 'qps': ...}, ...]
+    """
+    words = index.words
+    rng = np.random.RandomState(seed)
+    queries = [words[i] for i in rng.choice(len(words), min(n_queries, len(words)), replace=False)]
+
+    start = time.perf_counter()
+    exact = [set(w for w, _ in model.most_similar(q, topn=topn)) for q in queries]
+    elapsed = time.perf_counter() - start
+    results = [{'method': 'exact', 'nprobe': None, 'recall': 1.0, 'qps': len(queries) / elapsed}]
+
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        approx = [index.most_similar(q, topn=topn, nprobe=nprobe) for q in queries]
+        elapsed = time.perf_counter() - start
+        hits = sum(len(truth & set(w for w, _ in found)) for truth, found in zip(exact, approx))
+        results.append({'method': 'ivf', 'nprobe': nprobe,
+                        'recall': hits / float(sum(len(t) for t in exact)), 'qps': len(queries) / elapsed})
+    for r in results:
+        print('{method:>5} nprobe={nprobe!s:>4} recall@{topn}={recall:.3f} {qps:.0f} queries/s'.format(topn=topn, **r))
+    return results
+
+
+if __name__ == '__main__':
+    from gensim.models import KeyedVectors
+
+    word_vec = KeyedVectors.load(WORD2VEC_MODEL_PATH)
+    ann_index = load_ann_index(word_vec) or build_ann_index(word_vec)
+    benchmark(word_vec, ann_index)
@@ -0,0 +1,92 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: cache.py
+@time: 2019/10/21 15:30
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def text_key(text):
+    """
+    文本规范化(合并空白)后取哈希, 作为缓存的键
+    :param text:
+    :return:
+    """
+    normalized = ' '.join(text.split())
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+
+class LRUCache(object):
+    """
+    线程安全的LRU缓存, 支持过期时间, 并统计命中率
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expire, value = item
+                if expire is None or expire > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expire = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expire, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0}
+
+
+class ExtractionCache(object):
+    """
+    两级缓存: 句子级的LTP标注结果, 和其上的整篇抽取结果
+    """
+
+    def __init__(self, sentence_size, document_size, ttl=None):
+        self.sentences = LRUCache(sentence_size, ttl)
+        self.documents = LRUCache(document_size, ttl)
+
+    def clear(self):
+        self.sentences.clear()
+        self.documents.clear()
+
+    def stats(self):
+        return {'sentences': self.sentences.stats(), 'documents': self.documents.stats()}
@@ -1,34 +1,160 @@
-from gensim.models import KeyedVectors
-from collections import defaultdict
+import threading
+import weakref
+
+import numpy as np
 from apps.config import WORD2VEC_MODEL_PATH
 
-word_vec = KeyedVectors.load(WORD2VEC_MODEL_PATH)
+_word_vectors = {}
+_word_vectors_lock = threading.Lock()
+
+
+def get_word_vectors(path=WORD2VEC_MODEL_PATH):
+    """
+    第一次使用时才加载词向量, 向量矩阵以只读方式内存映射,
+    同一台机器上的所有worker进程共享同一份物理内存
+    :param path:
+    :return: KeyedVectors
+    """
+    model = _word_vectors.get(path)
+    if model is None:
+        with _word_vectors_lock:
+            model = _word_vectors.get(path)
+            if model is None:
+                from gensim.models import KeyedVectors
+                model = _word_vectors[path] = KeyedVectors.load(path, mmap='r')
+    return model
+
+
+def preload_word_vectors(path=WORD2VEC_MODEL_PATH, warm=True):
+    """
+    在fork worker之前由主进程调用, worker直接继承已加载的词表
+    :param path:
+    :param warm: 是否顺序读一遍向量文件, 让它进入页缓存
+    :return:
+    """
+    model = get_word_vectors(path)
+    if warm and isinstance(model.vectors, np.memmap):
+        step = max(1, 4096 // model.vectors.strides[0])  # 每页读一个元素
+        np.asarray(model.vectors[::step, 0]).sum()
+    return model
+
+
+class RelatedWordExpander(object):
+    """
+    基于词向量矩阵的相近词扩展, 每一层的整个frontier用一次矩阵乘法打分
+    """
+
+    def __init__(self, model, block_size=256):
+        """
+        :param model: KeyedVectors
+        :param block_size: 每次矩阵乘法的行数, 控制 (block_size, 词表大小) 打分矩阵的内存
+        """
+        self.vectors = model.vectors
+        # gensim 4 改名为 index_to_key / key_to_index
+        self.words = list(getattr(model, 'index_to_key', None) or model.index2word)
+        self.index = getattr(model, 'key_to_index', None) or {w: i for i, w in enumerate(self.words)}
+        norms = np.linalg.norm(self.vectors, axis=1)
+        norms[norms == 0] = 1.0
+        self.norms = norms.astype(self.vectors.dtype)
+        self.block_size = block_size
+
+    def most_similar_block(self, indexes, topn):
+        """
+        一次求出一批词各自的topn相近词
+        :param indexes: 词的下标数组
+        :param topn:
+        :return: 每行按相似度降序的 (下标, 相似度)
+        """
+        indexes = np.asarray(indexes)
+        query = self.vectors[indexes] / self.norms[indexes, None]
+        scores = np.dot(query, self.vectors.T)
+        scores /= self.norms
+        scores[np.arange(len(indexes)), indexes] = -np.inf  # 排除自身
+        k = min(topn, scores.shape[1] - 1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        result = []
+        for row, row_scores in zip(top, top_scores):
+            order = np.lexsort((row, -row_scores))  # 相似度降序, 相同时按下标, 保证结果确定
+            result.append((row[order], row_scores[order]))
+        return result
+
+    def expand(self, initial_words, size=500, topn=10, max_depth=None, min_similarity=None):
+        """
+        按层广度优先扩展, 已扩展过的词不再重复扩展
+        :param initial_words: 种子词, 不会被修改
+        :param size: 最多返回的词数
+        :param topn: 每个词取的相近词个数
+        :param max_depth: 最大扩展层数, None表示不限
+        :param min_similarity: 低于此相似度的词不再加入
+        :return: {词: 相似度}, 按发现顺序, 种子词的相似度为1
+        """
+        seen = {}
+        frontier = []
+        for word in initial_words:
+            if word in self.index and word not in seen and len(seen) < size:
+                seen[word] = 1.0
+                frontier.append(self.index[word])
+        depth = 0
+        while frontier and len(seen) < size and (max_depth is None or depth < max_depth):
+            next_frontier = []
+            begin = 0
+            while begin < len(frontier):
+                # 快满时每次只算少量的词, 避免为用不到的词做矩阵乘法
+                step = min(self.block_size, max(16, (size - len(seen)) // topn + 1))
+                block = frontier[begin:begin + step]
+                begin += step
+                for indexes, scores in self.most_similar_block(block, topn):
+                    for i, score in zip(indexes.tolist(), scores.tolist()):
+                        if min_similarity is not None and score < min_similarity:
+                            break
+                        word = self.words[i]
+                        if word in seen:
+                            continue
+                        seen[word] = score
+                        next_frontier.append(i)
+                        if len(seen) >= size:
+                            return seen
+            frontier = next_frontier
+            depth += 1
+        return seen
+
+
+_expanders = weakref.WeakKeyDictionary()
+
+
+def get_expander(model):
+    """
+    每个模型只计算一次范数
+    :param model:
+    :return:
+    """
+    expander = _expanders.get(model)
+    if expander is None:
+        expander = _expanders[model] = RelatedWordExpander(model)
+    return expander
 
 
-def get_related_word(initial_words, model, size=500, topn=10):
+def get_related_word(initial_words, model, size=500, topn=10, max_depth=None, min_similarity=None):
     """
     获取 相近词
     :param initial_words list
     :param model is the word2vec model.
-    :return
+    :param size: 最多返回的词数
+    :param topn: 每个词取的相近词个数
+    :param max_depth: 最大扩展层数
+    :param min_similarity: 相似度下限
+    :return {词: 相似度}
     """
-    unseen = initial_words
-    seen = defaultdict(int)
-    while unseen and len(seen) < size:
-        if len(seen) % 50 == 0:
-            print('seen length : {}'.format(len(seen)))
-        node = unseen.pop(0)
-        new_expanding = [w for w, s in model.most_similar(node, topn=topn)]
-        unseen += new_expanding
-        seen[node] += 1
-    return seen
+    return get_expander(model).expand(initial_words, size=size, topn=topn,
+                                      max_depth=max_depth, min_similarity=min_similarity)
 
 
 if __name__ == '__main__':
     seed = ['说', '否认', '坚称', '回应', '告诉', '反驳', '承认', '时说', '批评', '驳斥', '质疑', '议论', '宣称', '诋毁', '答道', '回答', '嘲讽',
             '写道', '争辩', '指出', '指证', '承认']
 
-    level_seen = get_related_word(seed, word_vec)
+    level_seen = get_related_word(seed, get_word_vectors())
 
     sort_v = sorted([(k, v) for k, v in level_seen.items()], reverse=True, key=lambda x: x[1])
 
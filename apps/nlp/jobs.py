@@ -0,0 +1,267 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: jobs.py
+@time: 2019/10/23 10:20
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from apps.nlp.ltp_pool import LTPManagerPool
+from apps.nlp.parse_news import LTPManager, SpeechExtractor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """
+    排队的任务数已达上限
+    """
+
+
+class JobWorkersFailed(Exception):
+    """
+    所有工作线程都没能加载模型, 提交的任务不会被处理
+    """
+
+
+class JobCancelled(Exception):
+    """
+    任务在运行中被取消
+    """
+
+
+class Job(object):
+    """
+    一篇长文本的抽取任务
+    """
+
+    def __init__(self, text):
+        self.id = uuid.uuid4().hex
+        self.text = text
+        self.chars = len(text)
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.expire = None  # 结束后的过期时间(monotonic)
+        self.cancel_requested = threading.Event()
+
+    def check(self):
+        if self.cancel_requested.is_set():
+            raise JobCancelled(self.id)
+
+    def to_dict(self):
+        job = {'id': self.id, 'status': self.status, 'chars': self.chars,
+               'submitted': self.submitted, 'started': self.started, 'finished': self.finished}
+        if self.status == DONE:
+            job['results'] = [{'person': r[0], 'say': r[1], 'content': r[2]} for r in self.result]
+        elif self.status == FAILED:
+            job['error'] = self.error
+        return job
+
+
+class JobManager(object):
+    """
+    进程内的异步抽取任务: 有界队列 + 固定个数的工作线程, 每个线程持有自己的LTPManager,
+    不占用处理请求的模型池; 结果保留result_ttl秒
+    """
+
+    def __init__(self, data_dir, synonyms_path, workers=1, queue_size=100, result_ttl=3600,
+                 tfidf_model=None, cache=None, segmenter=None, manager_factory=LTPManager):
+        self.data_dir = data_dir
+        self.synonyms_path = synonyms_path
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.tfidf_model = tfidf_model
+        self.cache = cache
+        self.segmenter = segmenter  # 为None时用各线程自己的LTP模型分词
+        self.manager_factory = manager_factory
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stop = threading.Event()
+        self.loaded = 0  # 已加载好模型的工作线程数
+        self.failed = 0  # 加载模型失败而退出的工作线程数
+        self.load_error = None  # 最近一次加载失败的原因
+
+    @property
+    def ready(self):
+        return self.loaded == self.workers and not self._stop.is_set()
+
+    @property
+    def dead(self):
+        """
+        所有工作线程都已因加载失败退出
+        """
+        return self.failed >= self.workers
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        """
+        启动工作线程, 模型在各自线程里加载, 不阻塞应用启动
+        :return:
+        """
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name='extract-job-{}'.format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """
+        停止工作线程, 排队中的任务标记为取消
+        :param timeout: 每个线程的最长等待时间
+        :return:
+        """
+        self._stop.set()
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status in (QUEUED, RUNNING):
+                    job.cancel_requested.set()
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)  # 唤醒空闲线程
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, text):
+        """
+        :param text: 新闻全文
+        :return: Job
+        """
+        if self._stop.is_set():
+            raise JobQueueFull('job manager is stopped')
+        self.expire_finished()
+        job = Job(text)
+        # 与工作线程退出时清空队列互斥, 避免任务在线程全部退出后入队
+        with self._lock:
+            if self.dead:
+                raise JobWorkersFailed('no job worker is running: {}'.format(self.load_error))
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise JobQueueFull('{} jobs already queued'.format(self._queue.maxsize))
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        """
+        :param job_id:
+        :return: Job, 不存在或已过期时返回None
+        """
+        self.expire_finished()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        排队中的任务直接取消; 运行中的任务在处理下一句之前停止
+        :param job_id:
+        :return: Job, 不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            job.cancel_requested.set()
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+            return job
+
+    def expire_finished(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, job in self._jobs.items() if job.expire is not None and job.expire <= now]
+            for k in expired:
+                del self._jobs[k]
+
+    def stats(self):
+        with self._lock:
+            counts = dict.fromkeys((QUEUED, RUNNING) + FINISHED, 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {'workers': self.workers, 'ready': self.ready, 'loaded': self.loaded, 'failed': self.failed,
+                'error': self.load_error, 'depth': self.depth, 'maxsize': self._queue.maxsize, 'jobs': counts}
+
+    def _finish(self, job, status, result=None, error=None):
+        # 调用方持有self._lock
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished = time.time()
+        job.expire = time.monotonic() + self.result_ttl
+        job.text = None  # 结束后不再保留原文
+
+    def _load_failed(self, error):
+        """
+        工作线程加载模型失败: 记录原因, 最后一个线程退出时排队中的任务全部标记为失败
+        """
+        with self._lock:
+            self.failed += 1
+            self.load_error = error
+            if not self.dead:
+                return
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None and job.status == QUEUED:
+                    self._finish(job, FAILED, error='no job worker is running: {}'.format(error))
+
+    def _run(self):
+        try:
+            manager = self.manager_factory(self.data_dir)
+            LTPManagerPool.warm_up(manager)
+        except Exception as e:
+            logger.exception('job worker %s failed to load the LTP model', threading.current_thread().name)
+            self._load_failed('{}: {}'.format(type(e).__name__, e))
+            return
+        with self._lock:
+            self.loaded += 1
+        try:
+            while not self._stop.is_set():
+                job = self._queue.get()
+                if job is None:
+                    break
+                with self._lock:
+                    if job.status != QUEUED:  # 排队时已被取消
+                        continue
+                    job.status = RUNNING
+                    job.started = time.time()
+                try:
+                    extractor = SpeechExtractor(job.text, self.synonyms_path, manager, self.tfidf_model,
+                                                self.cache, self.segmenter)
+                    result = extractor.process(check=job.check)
+                except JobCancelled:
+                    status, result, error = CANCELLED, None, None
+                except Exception as e:
+                    status, result, error = FAILED, None, '{}: {}'.format(type(e).__name__, e)
+                else:
+                    status, error = DONE, None
+                with self._lock:
+                    self._finish(job, status, result, error)
+        finally:
+            manager.release()
@@ -0,0 +1,120 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: ltp_pool.py
+@time: 2019/10/20 15:10
+"""
+import queue
+import threading
+from contextlib import contextmanager
+
+from apps.nlp.parse_news import LTPManager
+
+WARM_UP_TEXT = '新华社记者说，这是一件重要的事情。'
+
+
+class LTPPoolExhausted(Exception):
+    """
+    在等待时间内没有空闲的LTP模型
+    """
+
+
+class LTPManagerPool(object):
+    """
+    进程内共享的LTPManager池, 模型只在启动时加载一次
+    """
+
+    def __init__(self, data_dir, size=2, timeout=10, manager_factory=LTPManager):
+        self.data_dir = data_dir
+        self.size = size
+        self.timeout = timeout
+        self.manager_factory = manager_factory
+        self._managers = []
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def ready(self):
+        return not self._closed and len(self._managers) == self.size
+
+    @property
+    def available(self):
+        return self._idle.qsize()
+
+    def load(self):
+        """
+        加载并预热全部模型
+        :return:
+        """
+        with self._lock:
+            while len(self._managers) < self.size:
+                manager = self.manager_factory(self.data_dir)
+                self.warm_up(manager)
+                self._managers.append(manager)
+                self._idle.put(manager)
+        return self
+
+    @staticmethod
+    def warm_up(manager):
+        """
+        跑一遍完整流程, 让模型的首次调用开销发生在启动阶段
+        :param manager:
+        :return:
+        """
+        for sentence in manager.split_sentence(WARM_UP_TEXT):
+            words = manager.split_words(sentence)
+            postags = manager.pos(words)
+            manager.ner(words, postags)
+            manager.parsing(words, postags)
+
+    def checkout(self, timeout=None):
+        """
+        取出一个空闲的LTPManager, 必须配合checkin归还
+        :param timeout: 最长等待时间(秒), 默认使用池的配置
+        :return:
+        """
+        if self._closed:
+            raise LTPPoolExhausted('LTP pool is closed')
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise LTPPoolExhausted('no idle LTP model after waiting {}s (pool size {})'.format(timeout, self.size))
+
+    def checkin(self, manager):
+        """
+        归还LTPManager
+        :param manager:
+        :return:
+        """
+        self._idle.put(manager)
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """
+        取出一个空闲的LTPManager, 用完后自动归还
+        :param timeout:
+        :return:
+        """
+        manager = self.checkout(timeout)
+        try:
+            yield manager
+        finally:
+            self.checkin(manager)
+
+    def release(self):
+        """
+        释放全部模型
+        :return:
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for manager in self._managers:
+                manager.release()
+            self._managers = []
@@ -1,18 +1,70 @@
 import os
 import re
+import threading
 
-from apps.utils.load_data import load_synonyms
+from apps.utils.lexicon import lexicons
 from apps.config import SYNONYMS_PATH, LTP_MODEL_PATH
 from string import punctuation
 
-from pyltp import SentenceSplitter, Segmentor, Postagger, NamedEntityRecognizer, Parser
 from collections import defaultdict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from apps.nlp.tfidf import adjacent_similarity, load_tfidf_model
+from apps.nlp.cache import text_key
+from apps.nlp.segment import LTPSegmenter, token_offsets
+from apps.utils.metrics import metrics
 
 
 add_punc = '·，。、【 】 “”：；（）《》‘’{}？！⑦()、%^>℃：.”“^-——=&#@￥「」′° —『』'
 all_punc = punctuation + add_punc
+NEXT_SENTENCE_THRESHOLD = 0.05  # 相邻句相似度超过此值视为言论的延续
+CONTINUATION_WINDOW = 3  # 言论最多延续到后面几句
+# 言论动词之后第一个冒号或逗号之后为言论内容
+RE_QUOTE_START = re.compile(r'[，:：,]')
+# 词内的标点和空白一并删除
+punc_table = str.maketrans('', '', all_punc + '\t\n\r\x0b\x0c\u3000')
+
+
+class AnnotatedSentence(object):
+    """
+    一个句子的全部标注结果, 各阶段共用
+    """
+    __slots__ = ('text', 'words', 'offsets', 'postags', 'netags', 'arcs')
+
+    def __init__(self, text, words, offsets=None, postags=None, netags=None, arcs=None):
+        self.text = text  # 原句
+        self.words = words  # 去标点后的词
+        self.offsets = offsets  # 每个词在原句中的 (start, end)
+        self.postags = postags  # 词性
+        self.netags = netags  # 命名实体标签
+        self.arcs = arcs  # 依存弧 (head, relation)
+
+    def joined(self):
+        return ' '.join(self.words)
+
+
+class PipelineStats(object):
+    """
+    各阶段处理和跳过的句子数, 进程内累计
+    """
+    FIELDS = ('sentences', 'cached', 'segmented', 'no_verb', 'ner', 'no_entity', 'parsed')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, counts):
+        with self._lock:
+            for k, v in counts.items():
+                self.counts[k] += v
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = counts['sentences']
+        counts['parse_skip_rate'] = 1 - counts['parsed'] / total if total else 0.0
+        return counts
+
+
+pipeline_stats = PipelineStats()
 
 
 class LTPManager(object):
@@ -21,6 +73,8 @@ class LTPManager(object):
     """
 
     def __init__(self, data_dir):
+        # pyltp 只在真正加载模型时导入
+        from pyltp import Segmentor, Postagger, NamedEntityRecognizer, Parser
         self.LTP_DATA_DIR = data_dir
         # 分词模型
         cws_model = os.path.join(self.LTP_DATA_DIR, 'cws.model')
@@ -44,12 +98,14 @@ class LTPManager(object):
         self.parser.load(parse_model)
 
     @staticmethod
+    @metrics.timed('split_sentence')
     def split_sentence(content):
         """
         分句
         :param sentence:
         :return:
         """
+        from pyltp import SentenceSplitter
         sen = SentenceSplitter.split(content)
         sentences = [s for s in sen if s]
         return sentences
@@ -57,32 +113,34 @@ class LTPManager(object):
     def split_words(self, sentence):
         """
         分词
-        :param words:
-        :return:
+        :param sentence:
+        :return: 词列表
         """
         words = self.segmentor.segment(sentence)
-        return ' '.join(words)
+        return list(words)
 
+    @metrics.timed('pos')
     def pos(self, words):
         """
         词性标注
-        :param words:
+        :param words: 词列表
         :return:
         """
-        words = words.split(' ')
         postags = self.postagger.postag(words)
         return list(postags)
 
+    @metrics.timed('ner')
     def ner(self, words, postags):
         """
         命名实体识别
-        :param words:
+        :param words: 词列表
         :param postags:
         :return:
         """
-        netag = self.recongnizer.recognize(words.split(' '), postags)
+        netag = self.recongnizer.recognize(words, postags)
         return list(netag)
 
+    @metrics.timed('parse')
     def parsing(self, words, postags):
         """
         依存句法分析
@@ -104,21 +162,34 @@ class LTPManager(object):
 
 
 class SpeechExtractor(object):
-    def __init__(self, news, synonyms_path, ltp_manager):
+    def __init__(self, news, synonyms_path, ltp_manager, tfidf_model=None, cache=None, segmenter=None,
+                 continuation_window=CONTINUATION_WINDOW):
         self.news = news
-        self.synonyms = set(load_synonyms(synonyms_path))
+        lexicon = lexicons.get(synonyms_path)  # 进程内共享, 不读文件
+        self.synonyms = lexicon.words
+        self.synonyms_version = lexicon.version
         self.ltp_manager = ltp_manager
+        self.tfidf_model = tfidf_model  # 语料级tf-idf模型, 为None时按请求内的句子计算
+        self.cache = cache  # ExtractionCache, 为None时不缓存
+        # 分词后端, 默认使用同一个LTP模型; 词性标注等后续阶段始终由LTP完成
+        self.segmenter = segmenter or LTPSegmenter(ltp_manager)
+        self.continuation_window = continuation_window
 
-    def del_punc(self, sent):
+    def del_punc(self, sents):
         """
-        分词，去标点，分词
-        :param sent:
-        :return:
+        批量分词，在词级别去标点
+        :param sents: 句子列表
+        :return: 每句的 (词列表, 每个词在原句中的 (start, end))
         """
-        sent = self.ltp_manager.split_words(sent)
-        item_list = [item.strip() for item in sent if item.strip() not in all_punc]
-        sent_seg = self.ltp_manager.split_words(''.join(item_list))
-        return sent_seg
+        if not sents:
+            return []
+        with metrics.timer('segment'):
+            segmented = self.segmenter.segment_with_offsets(sents)
+        result = []
+        for words, offsets in segmented:
+            kept = [(w, o) for w, o in ((w.translate(punc_table), o) for w, o in zip(words, offsets)) if w]
+            result.append(([w for w, _ in kept], [o for _, o in kept]))
+        return result
 
     @classmethod
     def get_named_entity(cls, sentence_tag):
@@ -141,100 +212,226 @@ class SpeechExtractor(object):
                 i = j
         return ners
 
-    @classmethod
-    def calc_tf_idf(cls, text_list):
+    def calc_tf_idf(self, text_list):
         """
-        计算tf-idf
+        计算tf-idf, 优先使用语料级模型
         :param text_list:
         :return:
         """
-        tf_idf = TfidfVectorizer()
-        return tf_idf.fit_transform(text_list)
-
-    @classmethod
-    def cosine_sim(cls, x1, x2):
+        if self.tfidf_model is not None:
+            return self.tfidf_model.transform(text_list)
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        try:
+            return TfidfVectorizer().fit_transform(text_list)
+        except ValueError:  # 句子里没有可用的词
+            return None
+
+    @metrics.timed('tfidf')
+    def next_sentence_similarity(self, text_list):
         """
-        获取文本相似性
-        :param x1:
-        :param x2:
-        :return:
+        计算每句与下一句的相似度
+        :param text_list: 分词后的句子
+        :return: 长度为len(text_list)-1的数组
         """
-        return cosine_similarity(x1, x2)
+        tf_idf_vec = self.calc_tf_idf(text_list)
+        if tf_idf_vec is None:
+            return [0.0] * max(len(text_list) - 1, 0)
+        return adjacent_similarity(tf_idf_vec)
 
-    def has_next_sentence(self, x1, x2, threshold):
+    def has_candidate_verb(self, sent):
         """
-        判断是否有下一句话
-        :param x1:
-        :param x2:
-        :param threshold: 阈值
+        预筛: 分词结果中有言论动词; 所有句子都要分词(计算相邻句相似度), 直接查词集合
+        :param sent: AnnotatedSentence
         :return:
         """
-        sim = self.cosine_sim(x1, x2)[0][0]
-        if sim > threshold:
-            # print(sim)
-            return True
-        return False
-
-    def process(self):
+        return not self.synonyms.isdisjoint(sent.words)
 
+    def annotate(self, sents, check=None):
+        """
+        分阶段标注, 每一阶段只处理上一阶段留下的句子:
+        全部句子分词 -> 含言论动词的句子做词性标注和命名实体识别 -> 含命名实体的句子做依存句法分析
+        :param sents: 句子列表, 可以来自多篇新闻
+        :param check: 每句开始前调用, 可以抛出异常中止标注(如任务被取消)
+        :return: [AnnotatedSentence, ...], 被跳过的阶段对应字段为None
+        """
+        ltp = self.ltp_manager
+        cache = self.cache.sentences if self.cache is not None else None
+        counts = dict.fromkeys(PipelineStats.FIELDS, 0)
+        keys = [(self.segmenter.name, text_key(sent)) for sent in sents] if cache is not None else [None] * len(sents)
+        annotated = []
+        for sent, key in zip(sents, keys):
+            hit = cache.get(key) if cache is not None else None
+            if hit is not None:
+                counts['cached'] += 1
+                # 缓存的键合并了空白, 原句不同时重新对齐词的位置
+                offsets = hit.offsets if hit.text == sent else token_offsets(sent, hit.words)
+                hit = AnnotatedSentence(sent, hit.words, offsets, hit.postags, hit.netags, hit.arcs)
+            annotated.append(hit)
+        # 未命中缓存的句子一起分词
+        missed = [i for i, item in enumerate(annotated) if item is None]
+        for i, (words, offsets) in zip(missed, self.del_punc([sents[i] for i in missed])):
+            annotated[i] = AnnotatedSentence(sents[i], words, offsets)
+        counts['segmented'] = len(missed)
+        missed = set(missed)
+
+        for i, (item, key) in enumerate(zip(annotated, keys)):
+            if check is not None:
+                check()
+            counts['sentences'] += 1
+            changed = i in missed
+
+            if not self.has_candidate_verb(item):
+                counts['no_verb'] += 1
+            else:
+                if item.netags is None:
+                    # 词性标注
+                    item.postags = ltp.pos(item.words)
+                    # 命名实体识别
+                    item.netags = ltp.ner(item.words, item.postags)
+                    counts['ner'] += 1
+                    changed = True
+                if not self.get_named_entity(item.netags):
+                    counts['no_entity'] += 1
+                elif item.arcs is None:
+                    # 依存句法分析
+                    item.arcs = ltp.parsing(item.words, item.postags)
+                    counts['parsed'] += 1
+                    changed = True
+            if changed and cache is not None:
+                cache.put(key, item)
+        pipeline_stats.add(counts)
+        return annotated
+
+    def process(self, check=None):
+        """
+        :param check: 见annotate
+        :return: [(person, say, content), ...]
+        """
+        cache = self.cache.documents if self.cache is not None else None
+        if cache is not None:
+            key = (self.synonyms_version, self.segmenter.name, self.continuation_window, text_key(self.news))
+            result = cache.get(key)
+            if result is not None:
+                return list(result)
         # 分句
         sents = self.ltp_manager.split_sentence(self.news)
-        # 分词
-        sents_ = [self.del_punc(s) for s in sents]
-        # 词性标注
-        postags = [self.ltp_manager.pos(s) for s in sents_]
-        # 命名实体识别
-        ners = [self.ltp_manager.ner(s, p) for s, p in zip(sents_, postags)]
-        # 依存句法分析
-        arcs = [self.ltp_manager.parsing(w.split(' '), n) for w, n in zip(sents_, postags)]
-        # 计算句子间的tf-idf值
-        tf_idf_vec = self.calc_tf_idf(sents_)
+        result = self.extract(self.annotate(sents, check))
+        if cache is not None:
+            cache.put(key, tuple(result))
+        return result
+
+    def process_batch(self, documents, batch_size=32):
+        """
+        批量处理多篇新闻, 每batch_size篇的所有句子一起标注
+        :param documents: 新闻文本列表
+        :param batch_size:
+        :return: 逐篇产出 (序号, [(person, say, content), ...])
+        """
+        for begin in range(0, len(documents), batch_size):
+            batch = documents[begin:begin + batch_size]
+            cache = self.cache.documents if self.cache is not None else None
+            keys = [(self.synonyms_version, self.segmenter.name, self.continuation_window, text_key(doc))
+                    if cache is not None and doc else None for doc in batch]
+            cached = [cache.get(key) if key is not None else None for key in keys]
+            # 只对没有命中整篇缓存的新闻分句和标注
+            doc_sents = [self.ltp_manager.split_sentence(doc) if doc and hit is None else []
+                         for doc, hit in zip(batch, cached)]
+            annotated = self.annotate([s for sents in doc_sents for s in sents])
+            offset = 0
+            for i, sents in enumerate(doc_sents):
+                if cached[i] is not None:
+                    yield begin + i, list(cached[i])
+                    continue
+                end = offset + len(sents)
+                result = self.extract(annotated[offset:end]) if sents else []
+                offset = end
+                if keys[i] is not None:
+                    cache.put(keys[i], tuple(result))
+                yield begin + i, result
+
+    @metrics.timed('extract')
+    def extract(self, annotated):
+        """
+        根据标注结果抽取一篇新闻中的言论
+        :param annotated: 一篇新闻的 [AnnotatedSentence, ...]
+        :return: [(person, say, content), ...]
+        """
+        # 相邻句子间的tf-idf相似度
+        next_sim = self.next_sentence_similarity([a.joined() for a in annotated])
+        # 先找出每句中的说话人和言论动词, 言论的延续在下一处言论之前停止
+        speakers = [self.find_speakers(sent) for sent in annotated]
+        quote_sents = {idx for idx, found in enumerate(speakers) if found}
 
         result = []
-        for idx, ner in enumerate(ners):
-            ner_dict = self.get_named_entity(ner)
-            if not ner_dict:
-                continue
-            words = sents_[idx].split(' ')
-            # print(words)
-            sub_v = defaultdict(int)
-            for i, arc in enumerate(arcs[idx]):
-                if arc[1] == 'SBV':
-                    if (arc[0] - 1) not in sub_v.keys():
-                        sub_v[arc[0] - 1] = i
-                    else:
-                        if i > sub_v[arc[0] - 1]:
-                            sub_v[arc[0] - 1] = i
+        for idx in sorted(quote_sents):
+            sent = annotated[idx]
+            continued = self.continuation(annotated, next_sim, idx, quote_sents)
+            for sub, v in speakers[idx]:
+                # 按言论动词在原句中的位置切分, 动词在句中多次出现时也不会切错
+                tail = sent.text[sent.offsets[v][1]:]
+                speech = tail + continued
+                match = RE_QUOTE_START.search(speech)
+                if match is not None:
+                    speech = speech[match.end():]
+                    if speech.endswith('。'):
+                        speech = speech[:-1]
+                else:
+                    speech = tail
+                if speech:  # 言论动词在句末、之后没有内容时不输出空言论
+                    result.append((sub, sent.words[v], speech))
 
-            for v, s in sub_v.items():
-                if words[v] in self.synonyms:
-                    if s in ner_dict.keys():
-                        sub = ''.join(words[s:ner_dict[s]])
-                    else:
-                        l = [(n[0], n[1], s - n[0]) for n in list(ner_dict.items()) if n[0] < v and n[0] < s]
-                        if l:
-                            start, end, _ = min(l, key=lambda x: x[2])
-                            sub = ''.join(words[start:end])
-                        else:
-                            sub = words[s]
-                    said = words[v]
-                    speech = sents[idx].split(words[v])[1]
-
-                    # print('1: ', speech)
-
-                    if idx < len(ners) - 1 and self.has_next_sentence(tf_idf_vec[idx], tf_idf_vec[idx + 1], 0.05):
-                        speech += sents[idx + 1]
-                        # print('2:', speech)
-                    if speech[-1] != "。":
-                        speech = re.findall("(?:[^.。]*?)" + "(?:，|:|：|,)([\s\S]*?)$", speech)
-                        # print('3:', speech)
+        return result
 
-                    else:
-                        speech = re.findall("(?:[^.。]*?)" + "(?:，|:|：|,)([\s\S]*?)。$", speech)
+    def find_speakers(self, sent):
+        """
+        根据依存句法找出句中以言论动词为谓语的主语, 主语优先取命名实体
+        :param sent: AnnotatedSentence
+        :return: [(说话人, 言论动词的下标), ...], 预筛阶段跳过的句子返回空列表
+        """
+        if sent.arcs is None:  # 预筛阶段已跳过
+            return []
+        ner_dict = self.get_named_entity(sent.netags)
+        if not ner_dict:
+            return []
+        words = sent.words
+        sub_v = defaultdict(int)
+        for i, arc in enumerate(sent.arcs):
+            if arc[1] == 'SBV':
+                if (arc[0] - 1) not in sub_v.keys():
+                    sub_v[arc[0] - 1] = i
+                else:
+                    if i > sub_v[arc[0] - 1]:
+                        sub_v[arc[0] - 1] = i
 
-                    result.append((sub, said, speech[0])) if speech != [] else result.append((sub, said, sents[idx].split(words[v])[1]))
+        found = []
+        for v, s in sub_v.items():
+            if words[v] in self.synonyms:
+                if s in ner_dict.keys():
+                    sub = ''.join(words[s:ner_dict[s]])
+                else:
+                    l = [(n[0], n[1], s - n[0]) for n in list(ner_dict.items()) if n[0] < v and n[0] < s]
+                    if l:
+                        start, end, _ = min(l, key=lambda x: x[2])
+                        sub = ''.join(words[start:end])
+                    else:
+                        sub = words[s]
+                found.append((sub, v))
+        return found
 
-        return result
+    def continuation(self, annotated, next_sim, idx, quote_sents):
+        """
+        言论的延续: 其后与前一句相似的句子, 最多continuation_window句, 遇到另一处言论时停止
+        :param annotated: 一篇新闻的 [AnnotatedSentence, ...]
+        :param next_sim: 每句与下一句的相似度
+        :param idx: 言论所在句的序号
+        :param quote_sents: 含有言论的句子序号
+        :return: 延续部分的原文
+        """
+        end = idx + 1
+        last = min(idx + self.continuation_window, len(annotated) - 1)
+        while end <= last and next_sim[end - 1] > NEXT_SENTENCE_THRESHOLD and end not in quote_sents:
+            end += 1
+        return ''.join(a.text for a in annotated[idx + 1:end])
 
 
 if __name__ == '__main__':
@@ -262,7 +459,7 @@ if __name__ == '__main__':
 
     manager = LTPManager(LTP_MODEL_PATH)
     # extractor = SpeechExtractor(sentence2, SYNONYMS_PATH, manager)
-    extractor = SpeechExtractor(test_doc,SYNONYMS_PATH, manager)
+    extractor = SpeechExtractor(test_doc, SYNONYMS_PATH, manager, load_tfidf_model())
     res = extractor.process()
     print(res)
     manager.release()
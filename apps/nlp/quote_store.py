@@ -0,0 +1,240 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: quote_store.py
+@time: 2019/10/26 16:20
+"""
+import argparse
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from apps.config import QUOTE_STORE_PATH
+from apps.utils.normalize import normalize
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS quotes (
+    id INTEGER PRIMARY KEY,
+    speaker TEXT NOT NULL,          -- 规范化后的说话人, 用于查询
+    speaker_raw TEXT NOT NULL,      -- 原文中的写法, 用于展示
+    verb TEXT NOT NULL,
+    content TEXT NOT NULL,
+    doc_id TEXT,
+    content_key BLOB NOT NULL,      -- 内容哈希, 同一说话人的同一句话只保存一次
+    created REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_quotes_speaker_content ON quotes (speaker, content_key);
+CREATE INDEX IF NOT EXISTS idx_quotes_speaker_id ON quotes (speaker, id);
+CREATE INDEX IF NOT EXISTS idx_quotes_verb_id ON quotes (verb, id);
+-- 全文索引只保存倒排表, 不重复保存原文; 中文没有空格, 按字切开后建索引, 查询时按短语匹配
+-- 全文索引在每批写入后整批补上, 比逐行触发器快数倍
+CREATE VIRTUAL TABLE IF NOT EXISTS quotes_fts USING fts5 (content, content='', tokenize='unicode61');
+'''
+
+
+def normalize_speaker(name) -> str:
+    """
+    全角转半角、繁转简、去掉空白和标点(如"·")、英文小写
+    :param name:
+    :return:
+    """
+    return normalize(unicodedata.normalize('NFKC', str(name))).lower()
+
+
+def fts_text(text) -> str:
+    """
+    去标点、转简体后每个字之间加空格
+    :param text:
+    :return:
+    """
+    return ' '.join(normalize(unicodedata.normalize('NFKC', text)))
+
+
+def fts_phrase(term) -> str:
+    """
+    查询词转为FTS5短语, 匹配原文中连续出现的这些字
+    :param term:
+    :return: 查询词没有可检索的字时返回None
+    """
+    text = fts_text(term)
+    return '"{}"'.format(text.replace('"', '""')) if text else None
+
+
+def content_key(content) -> bytes:
+    return hashlib.blake2b(' '.join(content.split()).encode('utf-8'), digest_size=8).digest()
+
+
+class QuoteStore(object):
+    """
+    基于SQLite的言论库: 说话人和言论动词上有索引, 言论内容有全文索引
+    每个线程使用自己的连接, WAL模式下读写互不阻塞
+    """
+
+    def __init__(self, path=QUOTE_STORE_PATH, batch_size=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path)
+            db.row_factory = sqlite3.Row
+            db.create_function('fts_text', 1, fts_text, deterministic=True)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def add(self, quotes, doc_id=None):
+        """
+        批量写入, 每batch_size条一个事务, 已存在的(说话人, 内容)跳过
+        :param quotes: 可迭代的 (person, say, content) 或 (person, say, content, doc_id)
+        :param doc_id: 没有单独给出时使用的新闻id
+        :return: 新写入的条数
+        """
+        sql = 'INSERT OR IGNORE INTO quotes (speaker, speaker_raw, verb, content, doc_id, content_key, created) ' \
+              'VALUES (?, ?, ?, ?, ?, ?, ?)'
+        added = 0
+        rows = []
+        now = time.time()
+        for quote in quotes:
+            person, say, content = quote[:3]
+            speaker = normalize_speaker(person)
+            if not speaker or not content:
+                continue
+            rows.append((speaker, person, say, content, str(quote[3]) if len(quote) > 3 else doc_id,
+                         content_key(content), now))
+            if len(rows) >= self.batch_size:
+                added += self._write(sql, rows)
+                rows = []
+        if rows:
+            added += self._write(sql, rows)
+        return added
+
+    def _write(self, sql, rows):
+        """
+        一个事务内写入一批言论, 再把这批新行一次性加入全文索引
+        BEGIN IMMEDIATE 先拿到写锁, 保证读到的最大id之后都是本批写入的行
+        """
+        db = self.connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM quotes').fetchone()[0]
+            added = db.executemany(sql, rows).rowcount
+            db.execute('INSERT INTO quotes_fts (rowid, content) '
+                       'SELECT id, fts_text(content) FROM quotes WHERE id > ?', (last_id,))
+        except BaseException:
+            db.rollback()
+            raise
+        db.commit()
+        return added
+
+    def query(self, speaker=None, verb=None, text=None, limit=20, before=None):
+        """
+        按说话人、言论动词、内容中的词组合查询, 按写入顺序倒序
+        :param speaker: 说话人, 查询前规范化
+        :param verb: 言论动词
+        :param text: 内容中连续出现的字
+        :param limit:
+        :param before: 只返回id小于此值的言论, 用上一页最后一条的id翻页
+        :return: [dict, ...]
+        """
+        where, params = [], []
+        if text:
+            phrase = fts_phrase(text)
+            if phrase is None:
+                return []
+            where.append('quotes_fts MATCH ?')
+            params.append(phrase)
+        if speaker:
+            where.append('q.speaker = ?')
+            params.append(normalize_speaker(speaker))
+        if verb:
+            where.append('q.verb = ?')
+            params.append(verb)
+        if before is not None:
+            where.append('q.id < ?')
+            params.append(int(before))
+        if text:
+            sql = 'SELECT q.* FROM quotes_fts JOIN quotes q ON q.id = quotes_fts.rowid'
+        else:
+            sql = 'SELECT q.* FROM quotes q'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY q.id DESC LIMIT ?'
+        params.append(int(limit))
+        rows = self.connection().execute(sql, params).fetchall()
+        return [{'id': r['id'], 'person': r['speaker_raw'], 'speaker': r['speaker'], 'say': r['verb'],
+                 'content': r['content'], 'doc_id': r['doc_id']} for r in rows]
+
+    def count(self):
+        return self.connection().execute('SELECT COUNT(*) FROM quotes').fetchone()[0]
+
+    def top_speakers(self, limit=20):
+        rows = self.connection().execute(
+            'SELECT speaker, COUNT(*) AS n FROM quotes GROUP BY speaker ORDER BY n DESC LIMIT ?', (limit,)).fetchall()
+        return [(r['speaker'], r['n']) for r in rows]
+
+    def optimize(self):
+        """
+        大批量写入后合并全文索引的段, 提高查询速度
+        """
+        db = self.connection()
+        with db:
+            db.execute("INSERT INTO quotes_fts (quotes_fts) VALUES ('optimize')")
+        db.execute('ANALYZE')
+
+
+def index_news(store, ltp_manager, documents, synonyms_path, batch_size=32):
+    """
+    对整个新闻库抽取言论并写入言论库
+    :param store: QuoteStore
+    :param ltp_manager:
+    :param documents: 可迭代的 (新闻id, 新闻文本)
+    :param synonyms_path:
+    :param batch_size: 一起标注的新闻篇数
+    :return: 新写入的言论条数
+    """
+    from apps.nlp.parse_news import SpeechExtractor
+    from apps.utils.preprocessing import iter_chunks
+    extractor = SpeechExtractor(None, synonyms_path, ltp_manager)
+    added = indexed = 0
+    for chunk in iter_chunks(documents, batch_size * 10):
+        ids = [doc_id for doc_id, _ in chunk]
+        texts = [text if isinstance(text, str) else '' for _, text in chunk]
+        quotes = [(person, say, content, ids[i])
+                  for i, results in extractor.process_batch(texts, batch_size) for person, say, content in results]
+        added += store.add(quotes)
+        indexed += len(chunk)
+        print('indexed {} documents, {} new quotes'.format(indexed, added))
+    store.optimize()
+    return added
+
+
+if __name__ == '__main__':
+    from apps.config import LTP_MODEL_PATH, NEWS_DATA_PATH, SYNONYMS_PATH
+    from apps.nlp.parse_news import LTPManager
+    from apps.utils.preprocessing import iter_news_content
+
+    parser = argparse.ArgumentParser(description='抽取新闻库中的言论, 写入言论库')
+    parser.add_argument('--news', default=NEWS_DATA_PATH)
+    parser.add_argument('--db', default=QUOTE_STORE_PATH)
+    args = parser.parse_args()
+    manager = LTPManager(LTP_MODEL_PATH)
+    try:
+        index_news(QuoteStore(args.db), manager, enumerate(iter_news_content(args.news)), SYNONYMS_PATH)
+    finally:
+        manager.release()
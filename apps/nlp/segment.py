@@ -0,0 +1,158 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: segment.py
+@time: 2019/10/24 14:10
+"""
+import multiprocessing
+import threading
+
+from apps.config import LTP_MODEL_PATH
+
+
+class Segmenter(object):
+    """
+    分词后端接口: 一次对一批文本分词
+    """
+    name = None
+
+    def segment(self, texts):
+        """
+        :param texts: 文本列表
+        :return: 与texts一一对应的词列表
+        """
+        raise NotImplementedError
+
+    def segment_with_offsets(self, texts):
+        """
+        :param texts: 文本列表
+        :return: 与texts一一对应的 (词列表, 每个词在原文中的 (start, end))
+        """
+        return [(words, token_offsets(text, words)) for text, words in zip(texts, self.segment(texts))]
+
+    def close(self):
+        pass
+
+
+def token_offsets(text, tokens):
+    """
+    按顺序把词对齐到原文, 原文中词之间的空白等被分词丢掉的字符直接跳过
+    词与原文不一致(如词内的标点已删除)时逐字对齐, 找不到的词得到空区间
+    :param text: 原文
+    :param tokens: 词列表
+    :return: [(start, end), ...], text[start:end] 为词在原文中的位置
+    """
+    offsets = []
+    cursor = 0
+    for token in tokens:
+        start = text.find(token, cursor)
+        if start >= 0:
+            end = start + len(token)
+        else:
+            start = end = -1
+            for c in token:
+                pos = text.find(c, cursor if end < 0 else end)
+                if pos < 0:
+                    break
+                if start < 0:
+                    start = pos
+                end = pos + 1
+            if start < 0:
+                start = end = cursor
+        offsets.append((start, end))
+        cursor = end
+    return offsets
+
+
+def _jieba_lcut(text):
+    from apps.utils.preprocessing import get_jieba
+    return get_jieba().lcut(text)
+
+
+class JiebaSegmenter(Segmenter):
+    """
+    jieba分词, workers > 1 时在进程池中并行
+    jieba自带的 enable_parallel 会替换全局的 jieba.cut, 并且只按行切分单个字符串,
+    这里用同样的方式(fork进程, 每个进程加载一份词典)按文本分发, 不影响其他调用方
+    """
+    name = 'jieba'
+
+    def __init__(self, workers=1, chunk_size=256):
+        """
+        :param workers: 进程数, 为1时在当前进程分词
+        :param chunk_size: 每次发给子进程的文本数
+        """
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def segment(self, texts):
+        if self.workers <= 1 or len(texts) < 2 * self.chunk_size:
+            return [_jieba_lcut(text) for text in texts]
+        if self._pool is None:
+            from apps.utils.preprocessing import get_jieba
+            get_jieba().initialize()  # 先在父进程加载词典, 子进程fork后直接继承
+            self._pool = multiprocessing.Pool(self.workers)
+        return self._pool.map(_jieba_lcut, texts, chunksize=self.chunk_size)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class LTPSegmenter(Segmenter):
+    """
+    LTP分词, pyltp没有批量接口, 逐句调用同一个模型
+    """
+    name = 'ltp'
+
+    def __init__(self, ltp_manager=None, data_dir=LTP_MODEL_PATH):
+        """
+        :param ltp_manager: 已加载的LTPManager, 为None时在第一次分词时加载
+        :param data_dir:
+        """
+        self.ltp_manager = ltp_manager
+        self.data_dir = data_dir
+        self._owned = ltp_manager is None
+
+    def segment(self, texts):
+        if self.ltp_manager is None:
+            from apps.nlp.parse_news import LTPManager
+            self.ltp_manager = LTPManager(self.data_dir)
+        return [self.ltp_manager.split_words(text) for text in texts]
+
+    def close(self):
+        if self._owned and self.ltp_manager is not None:
+            self.ltp_manager.release()
+            self.ltp_manager = None
+
+
+SEGMENTERS = {
+    JiebaSegmenter.name: JiebaSegmenter,
+    LTPSegmenter.name: LTPSegmenter,
+}
+
+_segmenters = {}
+_segmenters_lock = threading.Lock()
+
+
+def get_segmenter(name, **kwargs):
+    """
+    进程内按名字和参数共享分词后端, 预处理的子进程各自创建一份
+    :param name: 'jieba' 或 'ltp'
+    :param kwargs: 后端的构造参数
+    :return: Segmenter
+    """
+    if name not in SEGMENTERS:
+        raise ValueError('unknown segmenter {!r}, choose from {}'.format(name, sorted(SEGMENTERS)))
+    key = (name, tuple(sorted(kwargs.items())))
+    with _segmenters_lock:
+        segmenter = _segmenters.get(key)
+        if segmenter is None:
+            segmenter = _segmenters[key] = SEGMENTERS[name](**kwargs)
+    return segmenter
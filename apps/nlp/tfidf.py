@@ -0,0 +1,145 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: tfidf.py
+@time: 2019/10/21 10:05
+"""
+import logging
+import os
+import pickle
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from apps.config import PROCESSED_DATA_PATH, TFIDF_MODEL_PATH
+from apps.utils import clock
+from apps.utils.corpus import is_binary_corpus, list_corpus, BinaryCorpus
+
+NEWS_CORPUS_PREFIX = 'processed_news'  # 预处理输出的新闻语料 processed_news.00000.txt 等, 不含wiki
+
+logger = logging.getLogger(__name__)
+
+
+def iter_corpus(path, prefix=None):
+    """
+    逐行读取预处理后的语料(已分词, 空格分隔)
+    :param path: 文件或文件夹, 文件夹中可以包含二进制语料
+    :param prefix: path为文件夹时只读取文件名以此开头的语料
+    :return:
+    """
+    if os.path.isfile(path) or is_binary_corpus(path):
+        files = [path]
+    else:
+        files = [f for f in list_corpus(path) if prefix is None or os.path.basename(f).startswith(prefix)]
+    for file_name in files:
+        if is_binary_corpus(file_name):
+            yield from (line for line in BinaryCorpus(file_name).iter_text() if line)
+            continue
+        with open(file_name, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+@clock
+def fit_tfidf_model(corpus_path, model_path, min_df=5, max_features=500000, prefix=NEWS_CORPUS_PREFIX):
+    """
+    在整个新闻语料上训练idf并保存, 模型用于新闻抽取, 不混入wiki语料
+    逐块统计文档频率, 内存只与词表大小有关, 不随语料篇数增长
+    :param corpus_path: 预处理后的语料
+    :param model_path: 模型保存路径
+    :param min_df: 忽略文档频率小于此值的词
+    :param max_features: 词表上限
+    :param prefix: corpus_path为文件夹时只使用文件名以此开头的语料
+    :return:
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(min_df=min_df, max_features=max_features, dtype=np.float32)
+    n_docs, df, tf = count_document_frequency(iter_corpus(corpus_path, prefix), vectorizer.build_analyzer())
+    set_idf(vectorizer, n_docs, df, tf)
+    tmp_path = model_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(vectorizer, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, model_path)
+    return vectorizer
+
+
+def count_document_frequency(docs, analyzer, chunk_size=10000):
+    """
+    流式统计文档频率和词频, 只保存计数, 不构建整个语料的文档-词矩阵
+    :param docs: 可迭代的文本
+    :param analyzer: 与模型相同的切词函数, TfidfVectorizer.build_analyzer()
+    :param chunk_size: 每块的文档数, 块内先计数再合并
+    :return: (文档数, 文档频率Counter, 词频Counter)
+    """
+    n_docs = 0
+    df, tf = Counter(), Counter()
+    docs = iter(docs)
+    for chunk in iter(lambda: list(islice(docs, chunk_size)), []):
+        chunk_df, chunk_tf = Counter(), Counter()
+        for doc in chunk:
+            tokens = analyzer(doc)
+            chunk_tf.update(tokens)
+            chunk_df.update(set(tokens))
+        df.update(chunk_df)
+        tf.update(chunk_tf)
+        n_docs += len(chunk)
+    return n_docs, df, tf
+
+
+def set_idf(vectorizer, n_docs, df, tf):
+    """
+    按 TfidfVectorizer.fit 的规则筛选词表并计算idf, 结果与直接fit相同:
+    文档频率在[min_df, max_df]内(整数为篇数, 小数为比例), 再按语料中的总词频保留前max_features个, 词表按字母序编号;
+    截断处词频相同时按字母序取舍(sklearn对并列的选择不固定)
+    :param vectorizer: 未训练的TfidfVectorizer
+    :param n_docs:
+    :param df: 文档频率
+    :param tf: 词频
+    :return:
+    """
+    min_df = vectorizer.min_df if isinstance(vectorizer.min_df, int) else vectorizer.min_df * n_docs
+    max_df = vectorizer.max_df if isinstance(vectorizer.max_df, int) else vectorizer.max_df * n_docs
+    terms = [t for t, n in df.items() if min_df <= n <= max_df]
+    if vectorizer.max_features is not None and len(terms) > vectorizer.max_features:
+        terms = sorted(terms, key=lambda t: (-tf[t], t))[:vectorizer.max_features]
+    if not terms:
+        raise ValueError('no terms remain after pruning with min_df={}, max_df={}'.format(min_df, max_df))
+    terms.sort()
+    vectorizer.vocabulary_ = {t: i for i, t in enumerate(terms)}
+    counts = np.array([df[t] for t in terms], dtype=np.float64)
+    smooth = int(vectorizer.smooth_idf)
+    vectorizer.idf_ = (np.log((n_docs + smooth) / (counts + smooth)) + 1).astype(vectorizer.dtype)
+
+
+def load_tfidf_model(model_path=TFIDF_MODEL_PATH):
+    """
+    加载语料级tf-idf模型, 文件不存在时返回None
+    :param model_path:
+    :return:
+    """
+    if not os.path.exists(model_path):
+        logger.warning('%s does not exist, fall back to per-request tf-idf', model_path)
+        return None
+    with open(model_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def adjacent_similarity(matrix):
+    """
+    一次算出所有相邻两行的余弦相似度
+    :param matrix: 行已做l2归一化的稀疏矩阵 (n, d)
+    :return: 长度为n-1的数组, 第i个是第i句和第i+1句的相似度
+    """
+    if matrix.shape[0] < 2:
+        return np.zeros(0, dtype=np.float32)
+    return np.asarray(matrix[:-1].multiply(matrix[1:]).sum(axis=1)).ravel()
+
+
+if __name__ == '__main__':
+    fit_tfidf_model(PROCESSED_DATA_PATH, TFIDF_MODEL_PATH)
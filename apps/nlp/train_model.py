@@ -1,40 +1,189 @@
-from gensim.models import Word2Vec
-from gensim.models.word2vec import PathLineSentences
+import argparse
+import json
 import os
 import multiprocessing
+import time
 from apps.config import PROCESSED_DATA_PATH, WORD2VEC_MODEL_PATH, DEFAULT_SYNONYMS_PATH
+from apps.config import WORD2VEC_FULL_MODEL_PATH, WORD2VEC_STATE_PATH
 from apps.utils import clock
+from apps.utils.corpus import is_binary_corpus, corpus_fingerprint, list_corpus, BinaryCorpus
+
+SPEECH_VERB = '说'
+
+
+def word2vec_params():
+    """
+    gensim 4 把 size 改名为 vector_size
+    """
+    import gensim
+    size_arg = 'vector_size' if int(gensim.__version__.split('.')[0]) >= 4 else 'size'
+    return {
+        'min_count': 10,  # 忽略词频小于此值的单词
+        'sg': 0,  # sg=0: CBOW
+        size_arg: 128,  # 词向量维度
+        'window': 20,  # 一个句子中当前单词和被预测单词的最大距离
+        'workers': multiprocessing.cpu_count(),  # 训练模型时使用的线程数
+    }
+
+
+def list_shards(path):
+    """
+    :param path: 预处理后的语料文件夹
+    :return: {文件名: 指纹}, 文件大小或修改时间变化视为新的分片; 二进制语料是一个文件夹
+    """
+    shards = {}
+    for file_name in list_corpus(path):
+        shards[os.path.basename(file_name)] = corpus_fingerprint(file_name)
+    return shards
+
+
+def load_state(state_path=WORD2VEC_STATE_PATH):
+    if not os.path.exists(state_path):
+        return {'shards': {}}
+    with open(state_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state, state_path=WORD2VEC_STATE_PATH):
+    tmp_file = state_path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_path)
+
+
+class ShardSentences(object):
+    """
+    依次读取多个分片, 可以重复迭代(建词表和训练各读一遍)
+    文本分片每次都要解码和切分, 二进制分片直接从内存映射的词id数组还原
+    """
+
+    def __init__(self, files):
+        self.files = files
+
+    def __iter__(self):
+        from gensim.models.word2vec import LineSentence
+        for file_name in self.files:
+            corpus = BinaryCorpus(file_name) if is_binary_corpus(file_name) else LineSentence(file_name)
+            for sentence in corpus:
+                yield sentence
+
+
+def save_checkpoint(model, trained_shards, model_path=WORD2VEC_FULL_MODEL_PATH, wv_path=WORD2VEC_MODEL_PATH):
+    """
+    保存完整模型(用于继续训练)和词向量(用于加载服务)
+    训练过的分片记录在完整模型里, 与模型一起原子替换, 无论是否 --full 两者都一致;
+    之后写出的状态文件只是便于查看和快速判断有没有新分片
+    :param model: Word2Vec
+    :param trained_shards: {文件名: 指纹}, 模型已训练过的全部分片
+    :param model_path:
+    :param wv_path:
+    :return:
+    """
+    # 完整模型保存为单个文件, 写完后替换
+    model.trained_shards = dict(trained_shards)
+    tmp_file = model_path + '.tmp'
+    model.save(tmp_file, sep_limit=float('inf'), separately=[])
+    os.replace(tmp_file, model_path)
+
+    # 词向量矩阵单独保存为.npy, 以便加载时内存映射; gensim按加载的文件名找.npy, 所以两个文件分别替换:
+    # 先替换矩阵, 再替换词表. 增量训练只在词表末尾追加新词, 中间读到的旧词表+新矩阵仍然一致;
+    # --full 重新建立词表, 两次替换之间加载的进程可能读到不匹配的词表和矩阵, 需要在训练结束后再加载
+    tmp_file = wv_path + '.tmp'
+    model.wv.save(tmp_file, separately=['vectors'])
+    os.replace(tmp_file + '.vectors.npy', wv_path + '.vectors.npy')
+    os.replace(tmp_file, wv_path)
+
+
+def write_synonyms(word_vectors, synonyms_path=DEFAULT_SYNONYMS_PATH, topn=100):
+    """
+    用更新后的词向量重新生成言论动词表, 原子替换, 服务进程的词表会自动重新加载
+    :param word_vectors: KeyedVectors
+    :param synonyms_path:
+    :param topn:
+    :return: 词列表
+    """
+    if SPEECH_VERB not in word_vectors:
+        print(SPEECH_VERB, ' is not in the vocabulary, keep ', synonyms_path)
+        return None
+    related_words = word_vectors.most_similar(SPEECH_VERB, topn=topn)  # [(词, 相似度), ...]
+    print(related_words)
+    words = [SPEECH_VERB] + [w for w, _ in sorted(related_words, key=lambda x: x[1], reverse=True)]
+    tmp_file = synonyms_path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for word in words:
+            f.write(word + '\n')
+    os.replace(tmp_file, synonyms_path)
+    return words
+
+
+def rebuild_ann_index(word_vectors, wv_path=WORD2VEC_MODEL_PATH):
+    """
+    词表变化后旧的近似最近邻索引不再可用, 已有索引时重新构建
+    """
+    from apps.nlp.ann import index_exists, build_ann_index
+    if index_exists(wv_path):
+        build_ann_index(word_vectors, wv_path)
 
 
 @clock
-def train_word2vec_model(path):
+def train_word2vec_model(path, full=False):
     """
     训练词向量
+    :param path: 预处理后的语料文件夹
+    :param full: 为True时在全部分片上重新训练, 否则加载已保存的模型, 只用新分片更新词表并继续训练
+    :return: Word2Vec, 没有新数据时返回None
     """
-    if os.path.exists(path):
+    from gensim.models import Word2Vec
+    if not os.path.exists(path):
+        print(path, ' does not exit')
+        return None
+    shards = list_shards(path)
+    state = load_state()
+    full = full or not os.path.exists(WORD2VEC_FULL_MODEL_PATH)
+    if full:
         print('Train Word2Vec model using all files under ', path)
-        model = Word2Vec(
-            PathLineSentences(path),  # 训练该文件夹下所有文件
-            min_count=10,  # 忽略词频小于此值的单词
-            sg=0,  # sg=0: CBOW
-            size=128,  # 一个句子中当前单词和被预测单词的最大距离
-            window=20,  # 一个句子中当前单词和被预测单词的最大距离
-            workers=multiprocessing.cpu_count()  # 训练模型时使用的线程数
-        )
-        related_words = model.most_similar('说', topn=100)
-        print(related_words)
-        words = sorted(related_words.items(), key=lambda x: x[1], reverse=True)
-        words = list(zip(*words))[0]
-        with open(DEFAULT_SYNONYMS_PATH, 'w', encoding='utf-8') as f:
-            for word in words:
-                f.write(word + '\n')
-        return model
+        new_shards = sorted(shards)
+        model = Word2Vec(ShardSentences([os.path.join(path, name) for name in new_shards]), **word2vec_params())
+        trained = {}
     else:
-        print(path, ' does not exit')
+        new_shards = [name for name, fingerprint in shards.items() if state['shards'].get(name) != fingerprint]
+        if not new_shards:
+            print('No new shards under ', path)
+            return None
+        model = Word2Vec.load(WORD2VEC_FULL_MODEL_PATH)
+        # 以模型里的记录为准: 上次保存模型后、写状态文件前中断时, 状态文件落后于模型
+        trained = getattr(model, 'trained_shards', None)
+        if trained is None:
+            trained = state['shards']
+        new_shards = [name for name, fingerprint in shards.items() if trained.get(name) != fingerprint]
+        if not new_shards:
+            print('No new shards under ', path)
+            state['shards'] = trained
+            save_state(state)
+            return None
+        changed = [name for name in new_shards if name in trained]
+        if changed:
+            print('Changed shards will be trained again: ', changed)
+        print('Update Word2Vec model with ', new_shards)
+        corpus = ShardSentences([os.path.join(path, name) for name in new_shards])
+        model.build_vocab(corpus, update=True)
+        model.train(corpus, total_examples=model.corpus_count, epochs=model.epochs)
+
+    trained = dict(trained)
+    trained.update((name, shards[name]) for name in new_shards)
+    save_checkpoint(model, trained)
+    state['shards'] = trained
+    state['updated'] = time.time()
+    state['vocab_size'] = len(model.wv.vectors)
+    save_state(state)
+
+    write_synonyms(model.wv)
+    rebuild_ann_index(model.wv)
+    return model
 
 
 if __name__ == '__main__':
-    word2vec_model = train_word2vec_model(PROCESSED_DATA_PATH)
-    word_vector = word2vec_model.wv
-    # del word2vec_model
-    word_vector.save(WORD2VEC_MODEL_PATH)
+    parser = argparse.ArgumentParser(description='训练词向量, 默认只用新的语料分片继续训练')
+    parser.add_argument('--full', action='store_true', help='在全部语料上重新训练')
+    args = parser.parse_args()
+    train_word2vec_model(PROCESSED_DATA_PATH, full=args.full)
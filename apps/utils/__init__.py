@@ -1,6 +1,7 @@
 import threading
 import datetime
 import time
+from functools import wraps
 
 thread_local = threading.local()
 thread_local.need = True
@@ -46,12 +47,14 @@ def clock(func):
     :return:
     """
 
+    @wraps(func)
     def clocked(*args, **kwargs):
-        t0 = time.time()
+        from apps.utils.metrics import metrics
+        t0 = time.perf_counter()
         result = func(*args, **kwargs)
-        elapsed = time.time() - t0
+        elapsed = time.perf_counter() - t0
         name = func.__name__
-        arg_str = ', '.join(repr(arg) for arg in args)
+        metrics.observe(name, elapsed, t0)
         print(name, ' :', elapsed, 's')
         return result
 
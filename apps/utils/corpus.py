@@ -0,0 +1,199 @@
+# coding = utf-8
+"""
+预处理后语料的两种格式
+text:   每行一句, 词之间用空格分隔
+binary: 一个文件夹, 包含
+        vocab.txt    每行一个词, 行号即词的id
+        ids.bin      所有句子依次拼接的词id (int32)
+        offsets.bin  每句在ids中的起止位置 (int64, 长度为句子数+1)
+        两个.bin文件都是没有文件头的原始数组, 用np.memmap只读映射
+"""
+import os
+import shutil
+
+import numpy as np
+
+ID_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+VOCAB_FILE = 'vocab.txt'
+IDS_FILE = 'ids.bin'
+OFFSETS_FILE = 'offsets.bin'
+
+
+def is_binary_corpus(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, VOCAB_FILE))
+
+
+def list_corpus(path):
+    """
+    预处理输出文件夹中的语料: text文件和binary文件夹, 跳过隐藏文件、未写完的临时文件和清单等json文件
+    :param path:
+    :return: 排序后的路径
+    """
+    paths = []
+    for name in sorted(os.listdir(path)):
+        file_name = os.path.join(path, name)
+        if name.startswith('.') or name.endswith(('.tmp', '.old', '.json')):
+            continue
+        if os.path.isfile(file_name) or is_binary_corpus(file_name):
+            paths.append(file_name)
+    return paths
+
+
+def corpus_fingerprint(path):
+    """
+    :param path: text语料文件或binary语料文件夹
+    :return: {'size': 总字节数, 'mtime': 修改时间}, binary语料的词表最后写入, 用它的修改时间
+    """
+    if not is_binary_corpus(path):
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in (VOCAB_FILE, IDS_FILE, OFFSETS_FILE))
+    return {'size': size, 'mtime': os.stat(os.path.join(path, VOCAB_FILE)).st_mtime}
+
+
+class TextCorpusWriter(object):
+    """
+    先写入临时文件, 关闭时替换
+    """
+
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.tmp_file = out_file + '.tmp'
+        self._f = open(self.tmp_file, 'w', encoding='utf-8')
+
+    def write(self, lines):
+        """
+        :param lines: 空格分隔的句子
+        :return:
+        """
+        self._f.writelines(line + '\n' for line in lines)
+
+    def close(self, commit=True):
+        self._f.close()
+        if commit:
+            os.replace(self.tmp_file, self.out_file)
+        else:
+            os.remove(self.tmp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(commit=exc_type is None)
+
+
+class BinaryCorpusWriter(object):
+    """
+    流式写出二进制语料, 先写入临时文件夹, 关闭时整体替换
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir.rstrip('/\\')
+        self.tmp_dir = self.out_dir + '.tmp'
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.vocab = {}
+        self.n_tokens = 0
+        self._ids = open(os.path.join(self.tmp_dir, IDS_FILE), 'wb')
+        self._offsets = open(os.path.join(self.tmp_dir, OFFSETS_FILE), 'wb')
+        self._offsets.write(np.zeros(1, dtype=OFFSET_DTYPE).tobytes())
+
+    def write(self, lines):
+        """
+        :param lines: 空格分隔的句子
+        :return:
+        """
+        vocab = self.vocab
+        ids, offsets = [], []
+        for line in lines:
+            for word in line.split():
+                i = vocab.get(word)
+                if i is None:
+                    i = vocab[word] = len(vocab)
+                ids.append(i)
+            offsets.append(self.n_tokens + len(ids))
+        self._ids.write(np.asarray(ids, dtype=ID_DTYPE).tobytes())
+        self._offsets.write(np.asarray(offsets, dtype=OFFSET_DTYPE).tobytes())
+        self.n_tokens += len(ids)
+
+    def close(self, commit=True):
+        self._ids.close()
+        self._offsets.close()
+        if not commit:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return
+        with open(os.path.join(self.tmp_dir, VOCAB_FILE), 'w', encoding='utf-8') as f:
+            f.writelines(word + '\n' for word in self.vocab)
+        old_dir = self.out_dir + '.old'
+        if os.path.exists(self.out_dir):
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.replace(self.out_dir, old_dir)
+        os.replace(self.tmp_dir, self.out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(commit=exc_type is None)
+
+
+def corpus_name(name, binary=False):
+    """
+    :param name: 不带扩展名的语料名
+    :param binary:
+    :return: text格式为 name.txt, binary格式为文件夹 name.bin
+    """
+    return name + ('.bin' if binary else '.txt')
+
+
+def open_corpus_writer(out_file, binary=False):
+    """
+    :param out_file: text格式为文件, binary格式为文件夹
+    :param binary:
+    :return:
+    """
+    return BinaryCorpusWriter(out_file) if binary else TextCorpusWriter(out_file)
+
+
+class BinaryCorpus(object):
+    """
+    读取二进制语料, 可重复迭代, 每句产出词列表
+    词id数组以只读方式内存映射, 句子切片不复制数据, 词直接取自词表中的同一个字符串对象, 不再解码和切分
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, VOCAB_FILE), 'r', encoding='utf-8') as f:
+            self.vocab = f.read().split('\n')[:-1]
+        self.ids = np.memmap(os.path.join(path, IDS_FILE), dtype=ID_DTYPE, mode='r') \
+            if os.path.getsize(os.path.join(path, IDS_FILE)) else np.zeros(0, dtype=ID_DTYPE)
+        self.offsets = np.memmap(os.path.join(path, OFFSETS_FILE), dtype=OFFSET_DTYPE, mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def sentence_ids(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self, block_size=65536):
+        vocab = self.vocab
+        # 每次映射一块句子, 内存占用与语料大小无关
+        for start in range(0, len(self), block_size):
+            offsets = self.offsets[start:start + block_size + 1].tolist()
+            base = offsets[0]
+            ids = self.ids[base:offsets[-1]].tolist()
+            for begin, end in zip(offsets, offsets[1:]):
+                yield [vocab[i] for i in ids[begin - base:end - base]]
+
+    def iter_text(self):
+        """
+        还原为空格分隔的句子
+        """
+        for words in self:
+            yield ' '.join(words)
+
+    @property
+    def nbytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in (VOCAB_FILE, IDS_FILE, OFFSETS_FILE))
@@ -7,11 +7,93 @@
 @file: get_data.py
 @time: 2019/10/11 22:42
 """
-import pymysql
+import json
+import logging
+import os
+import queue
+import re
 import sys
+from contextlib import contextmanager
+from functools import partial
+
+import pymysql
 sys.path.append('../')
 
-from apps.utils.preprocessing import token, cut
+from apps.utils.preprocessing import token, cut, bounded_imap
+from apps.utils.dedup import LSHDeduplicator, MinHasher, signature_chunk
+from apps.config import PREPROCESS_WORKERS, PREPROCESS_DEDUP_THRESHOLD, PREPROCESS_DEDUP_WINDOW
+
+logger = logging.getLogger(__name__)
+
+RE_IDENTIFIER = re.compile(r'^\w+$')
+
+
+def segment_rows(batch):
+    """
+    对一批记录去标点、分词, 在子进程中执行
+    :param batch: [(主键, 内容), ...]
+    :return: (这批最后的主键, 分词结果)
+    """
+    lines = [cut(token(''.join(content.split('\\n')))) for _, content in batch if content]
+    return batch[-1][0], lines
+
+
+def signature_rows(batch):
+    """
+    计算一批记录的MinHash签名, 在子进程中执行
+    :param batch: [(主键, 内容), ...]
+    :return:
+    """
+    return signature_chunk([content for _, content in batch])
+
+
+def dedup_batches(batches, deduplicator, workers):
+    """
+    把近似重复记录的内容置为None, 保留主键以便记录断点
+    :param batches:
+    :param deduplicator: LSHDeduplicator
+    :param workers:
+    :return:
+    """
+    for batch, signatures in bounded_imap(signature_rows, batches, workers):
+        yield [(k, None if deduplicator.is_duplicate(sig) else content) for (k, content), sig in zip(batch, signatures)]
+
+
+class ConnectionPool(object):
+    """
+    简单的连接池, 连接用完后放回复用
+    """
+
+    def __init__(self, connect, size=4):
+        """
+        :param connect: 无参数的函数, 返回一个新的DB-API连接
+        :param size: 最多保留的空闲连接数
+        """
+        self.connect = connect
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        try:
+            yield conn
+        except Exception:
+            conn.close()  # 出错的连接不再复用
+            raise
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
 
 
 class DatabaseHandle(object):
@@ -19,47 +101,135 @@ class DatabaseHandle(object):
     定义Mysql操作类
     """
 
-    def __init__(self, host, username, password, database, port):
+    def __init__(self, host, username, password, database, port, pool_size=4, connect=None, paramstyle='format'):
         """
         初始化创建数据
+        :param connect: 自定义的连接函数, 例如用sqlite3代替mysql
+        :param paramstyle: 连接所用驱动的占位符风格, pymysql为format, sqlite3为qmark
         """
         self.host = host
         self.username = username
         self.password = password
         self.database = database
         self.port = port
-        self.db = pymysql.connect(
-            self.host, self.username, self.password,
-            self.database, self.port,
-        )
+        if connect is None:
+            # 默认游标会先把整个结果集读进内存, 无缓冲游标边读边取, fetchmany 的内存才有上限
+            connect = partial(pymysql.connect, host=self.host, user=self.username, password=self.password,
+                              database=self.database, port=self.port, charset='utf8mb4',
+                              cursorclass=pymysql.cursors.SSCursor)
+        self.pool = ConnectionPool(connect, pool_size)
+        self.placeholder = '?' if paramstyle == 'qmark' else '%s'
 
-    def select(self, sql):
+    def select(self, sql, out_file='news-sql.txt', batch_size=1000, dedup=True):
         """
         数据库查询
         :param sql: 查询语句
-        :return: 表的内容
+        :param out_file: 分词结果的保存路径
+        :param batch_size: 每次从游标取出的行数
+        :param dedup: 分词前去掉近似重复(转载)的记录
+        :return:
         """
-        cursor = self.db.cursor()
-        try:
-            cursor.execute(sql)
-        except Exception as e:
-            print('error:{}\n'.format(e))
-            return
-        data = cursor.fetchall()  # 返回所有的内容
-        with open('news-sql.txt', 'w', encoding='utf-8') as fp:
-            for i in range(len(data)):
-                if not data[i][0]:
-                    print(data[i][0])
-                    continue
-                res = cut(token(''.join(data[i][0].split('\\n'))))
-                print('Finished {}\n'.format(i))
-                fp.write(res)
+        hasher = MinHasher() if dedup else None
+        deduplicator = LSHDeduplicator(threshold=PREPROCESS_DEDUP_THRESHOLD, window=PREPROCESS_DEDUP_WINDOW) if dedup else None
+        with self.pool.connection() as db:
+            cursor = db.cursor()
+            try:
+                cursor.execute(sql)
+            except Exception as e:
+                logger.error('error:%s', e)
+                return
+            count = 0
+            with open(out_file, 'w', encoding='utf-8') as fp:
+                rows = cursor.fetchmany(batch_size)
+                while rows:
+                    for row in rows:
+                        if row[0] and not (hasher and deduplicator.is_duplicate(hasher.signature(row[0]))):
+                            fp.write(cut(token(''.join(row[0].split('\\n')))) + '\n')
+                    count += len(rows)
+                    logger.info('Finished %d', count)
+                    rows = cursor.fetchmany(batch_size)
+            cursor.close()
+            if deduplicator is not None:
+                logger.info('removed %d of %d rows as near-duplicates', deduplicator.removed, deduplicator.documents)
+
+    def iter_batches(self, table, column, key, start, batch_size):
+        """
+        按主键分页读取, 每页一次查询, 不会一次把整张表读进内存
+        :return: [(主键, 内容), ...]
+        """
+        sql = 'SELECT {key}, {column} FROM {table} WHERE {key} > {p} ORDER BY {key} LIMIT {p}'.format(
+            key=key, column=column, table=table, p=self.placeholder)
+        last = start
+        while True:
+            with self.pool.connection() as db:
+                cursor = db.cursor()
+                cursor.execute(sql, (last, batch_size))
+                batch = cursor.fetchmany(batch_size)
+                cursor.close()
+            if not batch:
+                return
+            last = batch[-1][0]
+            yield batch
+
+    def export(self, table, column, out_file, key='id', batch_size=1000, workers=PREPROCESS_WORKERS, resume=True,
+               dedup=True):
+        """
+        流式导出并分词: 按主键分页读取, 多进程分词, 按顺序写出
+        每写完一批就记录断点(最后的主键和输出文件的长度), 中断后可以从断点继续
+        去重索引只在内存中, 从断点继续时不会与断点之前的记录比较
+        :param table: 表名
+        :param column: 文本列
+        :param out_file: 输出文件
+        :param key: 自增主键列
+        :param batch_size: 每页的行数
+        :param workers: 分词进程数
+        :param resume: 是否从上次的断点继续
+        :param dedup: 分词前去掉近似重复(转载)的记录
+        :return: 导出的行数
+        """
+        for name in (table, column, key):
+            if not RE_IDENTIFIER.match(name):
+                raise ValueError('invalid identifier: {}'.format(name))
+        checkpoint_file = out_file + '.ckpt'
+        start, offset = 0, 0
+        if resume and os.path.exists(checkpoint_file) and os.path.exists(out_file):
+            with open(checkpoint_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            start, offset = checkpoint['last_key'], checkpoint['offset']
+            logger.info('resume %s from %s=%s', table, key, start)
+
+        count = 0
+        with open(out_file, 'a+b' if offset else 'wb') as fp:
+            fp.truncate(offset)  # 丢弃断点之后写了一半的内容
+            fp.seek(offset)
+            batches = self.iter_batches(table, column, key, start, batch_size)
+            deduplicator = None
+            if dedup:
+                deduplicator = LSHDeduplicator(threshold=PREPROCESS_DEDUP_THRESHOLD, window=PREPROCESS_DEDUP_WINDOW)
+                batches = dedup_batches(batches, deduplicator, workers)
+            for batch, (last_key, lines) in bounded_imap(segment_rows, batches, workers):
+                fp.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+                fp.flush()
+                count += len(batch)
+                self.save_checkpoint(checkpoint_file, last_key, fp.tell())
+                logger.info('exported %d rows from %s, last %s=%s', count, table, key, last_key)
+        if deduplicator is not None:
+            logger.info('removed %d of %d rows from %s as near-duplicates',
+                        deduplicator.removed, deduplicator.documents, table)
+        return count
+
+    @staticmethod
+    def save_checkpoint(checkpoint_file, last_key, offset):
+        tmp_file = checkpoint_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'last_key': last_key, 'offset': offset}, f)
+        os.replace(tmp_file, checkpoint_file)
 
     def close(self):
         """
         关闭数据库链接
         """
-        self.db.close()
+        self.pool.close()
 
 
 if __name__ == "__main__":
@@ -76,6 +246,6 @@ if __name__ == "__main__":
 
     print('db connect success\n')
 
-    sql = 'select content from news_chinese'
-    db.select(sql)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    db.export(lite, 'content', 'news-sql.txt')
     db.close()
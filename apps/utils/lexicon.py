@@ -0,0 +1,114 @@
+"""
+进程内共享的词表(停用词、言论动词)
+每个词表只加载一次, 存为不可变的frozenset; 文件修改时间变化后在后台重新加载,
+用一次引用替换完成切换, 读取时不加锁也不访问文件
+"""
+import hashlib
+import os
+import threading
+
+from apps.utils.load_data import load_lines
+
+
+class Lexicon(object):
+    """
+    某一版本的词表
+    """
+    __slots__ = ('path', 'words', 'mtime', 'version')
+
+    def __init__(self, path, words, mtime, version):
+        self.path = path
+        self.words = words  # frozenset
+        self.mtime = mtime
+        self.version = version  # 内容哈希, 可用于缓存的键
+
+
+def read_lexicon(path):
+    """
+    读取词表文件, 文件不存在时返回空词表
+    :param path:
+    :return:
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        words = frozenset(load_lines(path))
+    except OSError as e:
+        print(e)
+        return Lexicon(path, frozenset(), None, '')
+    digest = hashlib.blake2b('\n'.join(sorted(words)).encode('utf-8'), digest_size=8).hexdigest()
+    return Lexicon(path, words, mtime, digest)
+
+
+class LexiconRegistry(object):
+
+    def __init__(self):
+        self._lexicons = {}
+        self._lock = threading.Lock()  # 只在加载时使用
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def get(self, path) -> Lexicon:
+        """
+        取当前版本的词表, 第一次使用时加载
+        :param path:
+        :return:
+        """
+        lexicon = self._lexicons.get(path)
+        if lexicon is None:
+            with self._lock:
+                lexicon = self._lexicons.get(path)
+                if lexicon is None:
+                    lexicon = read_lexicon(path)
+                    self._set(path, lexicon)
+        return lexicon
+
+    def words(self, path) -> frozenset:
+        return self.get(path).words
+
+    def _set(self, path, lexicon):
+        # 复制后整体替换, 读者看到的要么是旧字典要么是新字典
+        lexicons = dict(self._lexicons)
+        lexicons[path] = lexicon
+        self._lexicons = lexicons
+
+    def refresh(self):
+        """
+        重新加载修改时间发生变化的词表
+        :return: 重新加载了的文件
+        """
+        reloaded = []
+        with self._lock:
+            for path, lexicon in self._lexicons.items():
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue  # 文件暂时不存在时保留旧词表
+                if mtime != lexicon.mtime:
+                    self._set(path, read_lexicon(path))
+                    reloaded.append(path)
+        for path in reloaded:
+            print('reloaded lexicon ', path)
+        return reloaded
+
+    def start_watcher(self, interval=5.0):
+        """
+        启动后台线程, 每interval秒检查一次文件
+        :param interval:
+        :return:
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+
+        def watch():
+            while not self._stop.wait(interval):
+                self.refresh()
+
+        self._watcher = threading.Thread(target=watch, name='lexicon-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+
+lexicons = LexiconRegistry()
@@ -2,16 +2,24 @@
 加载数据
 """
 
-from apps.config import DEFAULT_STOPWORDS_PATH
+from apps.config import DEFAULT_STOPWORDS_PATH, DEFAULT_SYNONYMS_PATH
+
+
+def load_lines(file_name) -> list:
+    """
+    逐行读取词表, 去掉首尾空白和空行
+    :param file_name:
+    :return:
+    """
+    with open(file_name, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
 
 
 def load_synonyms(file_name=None) -> list:
     if file_name is None:
-        file_name = DEFAULT_STOPWORDS_PATH
+        file_name = DEFAULT_SYNONYMS_PATH
     try:
-        with open(file_name, 'r', encoding='utf-8') as f:
-            synonyms = [i.strip() for i in f.readlines()]
-        return synonyms
+        return load_lines(file_name)
     except Exception as e:
         print(e)
 
@@ -25,8 +33,6 @@ def load_stopwords(file_name=None) -> set:
     if file_name is None:
         file_name = DEFAULT_STOPWORDS_PATH
     try:
-        with open(file_name, 'r', encoding='utf-8') as f:
-            stopwords = set(line[:-1] for line in f)
-        return stopwords
+        return set(load_lines(file_name))
     except Exception as e:
         print(e)
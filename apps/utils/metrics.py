@@ -0,0 +1,180 @@
+"""
+低开销的耗时统计
+每个阶段一个固定分桶的直方图(perf_counter计时), 以Prometheus文本格式输出;
+可按比例采样请求, 记录该请求内每个阶段的完整耗时
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# 秒
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Trace(object):
+    """
+    一个被采样请求的各阶段耗时
+    """
+    __slots__ = ('name', 'start', 'spans', 'duration')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.spans = []  # (阶段, 开始偏移秒, 耗时秒)
+        self.duration = None
+
+    def to_dict(self):
+        return {'name': self.name, 'start': self.start, 'duration': self.duration,
+                'spans': [{'stage': s, 'offset': o, 'seconds': d} for s, o, d in self.spans]}
+
+
+class MetricsRegistry(object):
+
+    def __init__(self, trace_sample_rate=0.0, trace_keep=100):
+        self._histograms = {}  # (指标名, 标签值) -> Histogram
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.trace_sample_rate = trace_sample_rate
+        self.traces = deque(maxlen=trace_keep)
+
+    def configure(self, trace_sample_rate=None, trace_keep=None):
+        if trace_sample_rate is not None:
+            self.trace_sample_rate = trace_sample_rate
+        if trace_keep is not None:
+            self.traces = deque(self.traces, maxlen=trace_keep)
+
+    def histogram(self, name, label):
+        key = (name, label)
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram())
+        return hist
+
+    def observe(self, stage, seconds, start=None):
+        self.histogram('nlp_stage_seconds', stage).observe(seconds)
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            offset = (start - trace.start_perf) if start is not None else None
+            trace.trace.spans.append((stage, offset, seconds))
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.observe(stage, end - start, start)
+
+    def timed(self, stage):
+        """
+        装饰器, 统计函数的耗时
+        :param stage: 阶段名
+        :return:
+        """
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    end = time.perf_counter()
+                    self.observe(stage, end - start, start)
+
+            return wrapper
+
+        return decorator
+
+    def observe_request(self, endpoint, seconds):
+        self.histogram('nlp_request_seconds', endpoint).observe(seconds)
+
+    def start_trace(self, name):
+        """
+        按采样率决定是否记录当前线程上这个请求的完整耗时
+        :param name:
+        :return: 是否被采样
+        """
+        if self.trace_sample_rate <= 0 or random.random() >= self.trace_sample_rate:
+            self._local.trace = None
+            return False
+        self._local.trace = _ActiveTrace(Trace(name), time.perf_counter())
+        return True
+
+    def finish_trace(self):
+        active = getattr(self._local, 'trace', None)
+        self._local.trace = None
+        if active is None:
+            return None
+        active.trace.duration = time.perf_counter() - active.start_perf
+        self.traces.append(active.trace)
+        return active.trace
+
+    def render(self, extra=None):
+        """
+        Prometheus 文本格式
+        :param extra: 额外的 {指标名: {标签值或None: 数值}} 以gauge输出
+        :return:
+        """
+        lines = []
+        label_names = {'nlp_stage_seconds': 'stage', 'nlp_request_seconds': 'endpoint'}
+        for name in sorted(set(k[0] for k in self._histograms)):
+            lines.append('# TYPE {} histogram'.format(name))
+            for (metric, label), hist in sorted(self._histograms.items()):
+                if metric != name:
+                    continue
+                counts, total, count = hist.snapshot()
+                tag = '{}="{}"'.format(label_names.get(name, 'label'), label)
+                cumulative = 0
+                for bound, n in zip(hist.buckets + (float('inf'),), counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, tag, le, cumulative))
+                lines.append('{}_sum{{{}}} {}'.format(name, tag, total))
+                lines.append('{}_count{{{}}} {}'.format(name, tag, count))
+        for name, values in sorted((extra or {}).items()):
+            lines.append('# TYPE {} gauge'.format(name))
+            for label, value in sorted(values.items(), key=lambda x: str(x[0])):
+                if label is None:
+                    lines.append('{} {}'.format(name, value))
+                else:
+                    lines.append('{}{{{}}} {}'.format(name, label, value))
+        return '\n'.join(lines) + '\n'
+
+
+class _ActiveTrace(object):
+    __slots__ = ('trace', 'start_perf')
+
+    def __init__(self, trace, start_perf):
+        self.trace = trace
+        self.start_perf = start_perf
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,62 @@
+# coding = utf-8
+"""
+一次 str.translate 完成去标点和繁转简
+结果与 token() 后再 HanziConv.toSimplified() 相同: 两步都是逐字符的, 非\\w字符删除, 其余字符按繁简对照表替换
+"""
+import re
+import threading
+
+RE_WORD_CHAR = re.compile(r'\w')
+
+
+class NormalizeTable(dict):
+    """
+    str.translate 使用的映射表, 字符第一次出现时才计算并缓存, 不需要预先枚举全部unicode字符
+    """
+
+    def __init__(self, traditional, simplified):
+        super(NormalizeTable, self).__init__()
+        self.to_simplified = {}
+        for t, s in zip(traditional, simplified):
+            self.to_simplified.setdefault(t, s)  # 与 HanziConv 一样取对照表中第一次出现的位置
+
+    def __missing__(self, code):
+        c = chr(code)
+        if RE_WORD_CHAR.match(c) is None:
+            value = None  # 删除
+        else:
+            value = self.to_simplified.get(c, code)
+        self[code] = value
+        return value
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_normalize_table() -> NormalizeTable:
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                from hanziconv.charmap import traditional_charmap, simplified_charmap
+                _table = NormalizeTable(traditional_charmap, simplified_charmap)
+    return _table
+
+
+def normalize(text) -> str:
+    """
+    去标点、转简体
+    :param text:
+    :return:
+    """
+    return str(text).translate(get_normalize_table())
+
+
+def normalize_batch(lines) -> list:
+    """
+    :param lines:
+    :return: 与lines一一对应
+    """
+    table = get_normalize_table()
+    return [str(line).translate(table) for line in lines]
@@ -2,16 +2,72 @@
 """
 文本预处理
 """
+import hashlib
+import json
 import os
-import pandas as pd
+import shutil
+import time
+import multiprocessing
 import re
-import jieba
-from hanziconv import HanziConv
-from apps.utils.load_data import load_stopwords
+from apps.utils.lexicon import lexicons
 from apps.utils import clock
+from apps.utils.corpus import open_corpus_writer, corpus_name
+from apps.utils.dedup import LSHDeduplicator, signature_chunk, save_signatures, load_signatures
+from apps.utils.normalize import normalize, normalize_batch
+from collections import deque
+from functools import partial
 from apps.config import DEFAULT_STOPWORDS_PATH, WIKI_DATA_PATH, NEWS_DATA_PATH, PROCESSED_DATA_PATH
+from apps.config import PREPROCESS_WORKERS, PREPROCESS_CHUNK_SIZE, PREPROCESS_SEGMENTER, PREPROCESS_BINARY
+from apps.config import PREPROCESS_DEDUP, PREPROCESS_DEDUP_THRESHOLD, PREPROCESS_DEDUP_WINDOW, JIEBA_CACHE_PATH
+from apps.config import PREPROCESS_SHARD_SIZE, PREPROCESS_MANIFEST_PATH
+from apps.nlp.segment import get_segmenter
 
-STOPWORDS = load_stopwords(DEFAULT_STOPWORDS_PATH)
+# jieba、hanziconv、pandas 都在第一次使用时才导入
+_lazy = {}
+
+
+def get_jieba():
+    """
+    加载jieba, 并使用部署时预先生成的词典缓存
+    :return:
+    """
+    jieba = _lazy.get('jieba')
+    if jieba is None:
+        import jieba
+        jieba.dt.cache_file = JIEBA_CACHE_PATH
+        _lazy['jieba'] = jieba
+    return jieba
+
+
+def prebuild_jieba_cache():
+    """
+    部署时调用, 生成jieba的前缀词典缓存, worker启动后直接读取缓存
+    :return:
+    """
+    get_jieba().initialize()
+    return JIEBA_CACHE_PATH
+
+
+def get_stopwords() -> frozenset:
+    return lexicons.words(DEFAULT_STOPWORDS_PATH)
+
+
+def to_simplified(string) -> str:
+    convert = _lazy.get('to_simplified')
+    if convert is None:
+        from hanziconv import HanziConv
+        convert = _lazy['to_simplified'] = HanziConv.toSimplified
+    return convert(string)
+
+
+def skip_bad_lines() -> dict:
+    """
+    pandas 1.3 起用 on_bad_lines 代替 error_bad_lines
+    """
+    import pandas as pd
+    if tuple(int(v) for v in pd.__version__.split('.')[:2]) >= (1, 3):
+        return {'on_bad_lines': 'skip'}
+    return {'error_bad_lines': False}
 
 
 def cut(string) -> str:
@@ -20,7 +76,7 @@ def cut(string) -> str:
     :param string:
     :return:
     """
-    return ' '.join(jieba.cut(string))
+    return ' '.join(get_jieba().cut(string))
 
 
 def token(string) -> str:
@@ -37,60 +93,380 @@ def cut4wiki(string) -> list:
     if len(line) < 1 or line.startswith('doc'):  # empty line
         pass
     else:
-        return jieba.cut(line)
+        return get_jieba().cut(line)
+
+
+def keep_sentence(sentence, wiki=False) -> bool:
+    """
+    :param sentence: 去标点、转简体之后的文本
+    :param wiki: wiki语料需要跳过<doc>标签行
+    :return:
+    """
+    return sentence != '' and not (wiki and sentence.startswith('doc'))
+
+
+def normalize_line(line, wiki=False):
+    """
+    去标点、转简体, 与 to_simplified(token(line)) 结果相同
+    :param line:
+    :param wiki: wiki语料需要跳过<doc>标签行
+    :return: 待分词的文本, 需要跳过的行返回None
+    """
+    sentence = normalize(line)
+    return sentence if keep_sentence(sentence, wiki) else None
+
+
+def clean_line(line, wiki=False, segmenter=PREPROCESS_SEGMENTER):
+    """
+    去标点、转简体、分词、去停用词
+    :param line:
+    :param wiki: wiki语料需要跳过<doc>标签行
+    :param segmenter: 分词后端的名字
+    :return: 空格分隔的词, 需要跳过的行返回None
+    """
+    cleaned = clean_chunk([line], wiki, segmenter)
+    return cleaned[0] if cleaned else None
+
+
+def clean_chunk(lines, wiki=False, segmenter=PREPROCESS_SEGMENTER) -> list:
+    """
+    处理一批行, 在子进程中执行, 整批一起分词
+    :param lines:
+    :param wiki:
+    :param segmenter: 分词后端的名字, 每个子进程创建一份
+    :return:
+    """
+    sentences = [s for s in normalize_batch(lines) if keep_sentence(s, wiki)]
+    stopwords = get_stopwords()
+    return [' '.join([word for word in words if word not in stopwords])
+            for words in get_segmenter(segmenter).segment(sentences)]
+
+
+def iter_chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ProgressReporter(object):
+    """
+    定期打印处理速度
+    """
+
+    def __init__(self, name, interval=10.0):
+        self.name = name
+        self.interval = interval
+        self.lines = 0
+        self.start = self.last = time.perf_counter()
+
+    def update(self, n):
+        self.lines += n
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            print('{}: {} lines, {:.0f} lines/s'.format(self.name, self.lines, self.lines / (now - self.start)))
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        print('{}: finished {} lines in {:.1f}s, {:.0f} lines/s'.format(
+            self.name, self.lines, elapsed, self.lines / elapsed if elapsed else 0.0))
+
+
+def bounded_imap(func, tasks, workers=PREPROCESS_WORKERS, pool=None):
+    """
+    有界的有序并行map: 同时在途的任务不超过 2 * workers 个, 结果按输入顺序产出
+    :param func: 可被pickle的函数, 参数为单个任务
+    :param tasks: 可迭代的任务
+    :param workers: 进程数, 为1时在当前进程执行
+    :param pool: 调用方持有的进程池, 为None时临时创建
+    :return:
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield task, func(task)
+        return
+    if pool is None:
+        with multiprocessing.Pool(workers) as pool:
+            yield from bounded_imap(func, tasks, workers, pool)
+        return
+    max_pending = 2 * workers
+    pending = deque()
+    for task in tasks:
+        pending.append((task, pool.apply_async(func, (task,))))
+        if len(pending) >= max_pending:
+            task, res = pending.popleft()
+            yield task, res.get()
+    while pending:
+        task, res = pending.popleft()
+        yield task, res.get()
+
+
+def new_deduplicator():
+    return LSHDeduplicator(threshold=PREPROCESS_DEDUP_THRESHOLD, window=PREPROCESS_DEDUP_WINDOW)
+
+
+def iter_signatures(lines, num_perm, workers=PREPROCESS_WORKERS, chunk_size=PREPROCESS_CHUNK_SIZE, pool=None):
+    """
+    在进程池中并行计算签名, 按输入顺序产出
+    :return: (文本块, 签名列表)
+    """
+    func = partial(signature_chunk, num_perm=num_perm)
+    return bounded_imap(func, iter_chunks(lines, chunk_size), workers, pool)
+
+
+def dedup_lines(lines, deduplicator, workers=PREPROCESS_WORKERS, chunk_size=PREPROCESS_CHUNK_SIZE, pool=None,
+                signatures=None):
+    """
+    去掉近似重复的文本: 签名在进程池中并行计算, 按输入顺序查询LSH索引
+    :param lines: 可迭代的原始文本
+    :param deduplicator: LSHDeduplicator, 统计去掉的条数
+    :param workers:
+    :param chunk_size:
+    :param pool: 见bounded_imap
+    :param signatures: 不为None时依次追加每条文本的签名
+    :return: 保留的文本
+    """
+    for chunk, chunk_signatures in iter_signatures(lines, deduplicator.num_perm, workers, chunk_size, pool):
+        if signatures is not None:
+            signatures.extend(chunk_signatures)
+        for line, sig in zip(chunk, chunk_signatures):
+            if not deduplicator.is_duplicate(sig):
+                yield line
+
+
+def process_corpus(lines, out_file, wiki=False, workers=PREPROCESS_WORKERS, chunk_size=PREPROCESS_CHUNK_SIZE,
+                   segmenter=PREPROCESS_SEGMENTER, binary=PREPROCESS_BINARY, dedup=False, deduplicator=None,
+                   pool=None, signatures=None):
+    """
+    多进程流式预处理: 按块读入, 分发到进程池, 按输入顺序写出
+    同时在途的块不超过 2 * workers 个, 内存占用与语料大小无关
+    :param lines: 可迭代的原始文本行
+    :param out_file: 输出文件, binary格式为文件夹
+    :param wiki:
+    :param workers: 进程数, 为1时在当前进程处理
+    :param chunk_size: 每块的行数
+    :param segmenter: 分词后端的名字
+    :param binary: 输出词表+词id数组, 见 apps.utils.corpus
+    :param dedup: 分词前去掉近似重复的文本
+    :param deduplicator: 多次调用共用的LSHDeduplicator, 为None时在本次调用内去重
+    :param pool: 多次调用共用的进程池, 见bounded_imap
+    :param signatures: 见dedup_lines
+    :return: 去重之后的行数
+    """
+    progress = ProgressReporter(os.path.basename(out_file))
+    owned = dedup and deduplicator is None
+    if owned:
+        deduplicator = new_deduplicator()
+    if dedup:
+        lines = dedup_lines(lines, deduplicator, workers, chunk_size, pool, signatures)
+    func = partial(clean_chunk, wiki=wiki, segmenter=segmenter)
+    with open_corpus_writer(out_file, binary) as writer:
+        for chunk, cleaned in bounded_imap(func, iter_chunks(lines, chunk_size), workers, pool):
+            writer.write(cleaned)
+            progress.update(len(chunk))
+    progress.finish()
+    if owned:
+        deduplicator.report(os.path.basename(out_file))
+    return progress.lines
+
+
+def iter_news_content(data_path, chunk_size=PREPROCESS_CHUNK_SIZE):
+    """
+    分块读取新闻csv的content列
+    :param data_path:
+    :param chunk_size:
+    :return:
+    """
+    # columns: index, author, pulisher, content, code, title, url
+    import pandas as pd
+    reader = pd.read_csv(data_path, usecols=[3], chunksize=chunk_size, **skip_bad_lines())
+    for frame in reader:
+        for content in frame.iloc[:, 0]:
+            yield content
 
 
 @clock
-def train_data_from_wiki(wiki_path, out_file):
+def train_data_from_wiki(wiki_path, out_file, workers=PREPROCESS_WORKERS):
     """
     预处理wiki数据
     :param wiki_path: wiki数据路径
     :param out_file: clean_file_path
+    :param workers: 进程数
     :return:
     """
     if os.path.exists(wiki_path):
+        print('Now processing:' + wiki_path)
         with open(wiki_path, 'r', encoding='utf-8') as f:
-            corpus = f.readlines()
-            print('Now processing:' + wiki_path)
-            with open(out_file, 'w', encoding='utf-8') as f:
-                for sentence in corpus:
-                    sentence = token(str(sentence))
-                    if sentence == '': continue
-                    words = cut4wiki(HanziConv.toSimplified(sentence))
-                    if words:
-                        sentences_by_word = ' '.join(word for word in words if word not in STOPWORDS)
-                        f.write(sentences_by_word + '\n')
+            process_corpus(f, out_file, wiki=True, workers=workers)
     else:
         print('Not Found {}'.format(wiki_path))
 
 
 @clock
-def train_data_from_news(data_path, out_file):
+def train_data_from_news(data_path, out_file, workers=PREPROCESS_WORKERS, dedup=PREPROCESS_DEDUP):
     """
     从新闻语料库下载的csv文档里拿数据
+    :param dedup: 去掉转载的近似重复新闻
     """
-    # sentences_by_word = ''
     if os.path.exists(data_path):
         print('Read data from ', data_path)
-        news = pd.read_csv(data_path, error_bad_lines=False)
-        news.columns = ['index', 'author', 'pulisher', 'content', 'code', 'title', 'url']
-        content = news.iloc[:, 3]  # 获取content
-        with open(out_file, 'w', encoding='utf-8') as f:
-            for sentence in content:
-                sentence = token(str(sentence))
-                if sentence == '': continue
-                words = jieba.cut(HanziConv.toSimplified(sentence))
-                sentences_by_word = ' '.join(word for word in words if word not in STOPWORDS)
-
-                f.write(sentences_by_word + '\n')
+        process_corpus(iter_news_content(data_path), out_file, workers=workers, dedup=dedup)
     else:
         print(data_path, ' does not exit')
 
 
+def shard_hash(lines, previous='') -> str:
+    """
+    :param lines:
+    :param previous: 前一个分片的哈希, 跨分片去重时分片的结果还取决于之前的分片
+    :return:
+    """
+    h = hashlib.blake2b(previous.encode('utf-8'), digest_size=16)
+    for line in lines:
+        h.update(str(line).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def load_manifest(manifest_path=PREPROCESS_MANIFEST_PATH) -> dict:
+    if not os.path.exists(manifest_path):
+        return {'shards': {}}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path=PREPROCESS_MANIFEST_PATH):
+    tmp_file = manifest_path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_file, manifest_path)
+
+
+def signature_path(out_dir, out_name):
+    # 以.开头的文件夹不会被当作语料读取
+    return os.path.join(out_dir, '.signatures', out_name + '.npz')
+
+
+def remove_output(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+@clock
+def update_train_data(name, lines, wiki=False, out_dir=PROCESSED_DATA_PATH, workers=PREPROCESS_WORKERS,
+                      shard_size=PREPROCESS_SHARD_SIZE, binary=PREPROCESS_BINARY, dedup=False,
+                      segmenter=PREPROCESS_SEGMENTER):
+    """
+    增量预处理: 输入按shard_size行切分, 每个分片按内容哈希记录在清单中,
+    只处理新增或内容变化的分片, 分词后端、停用词表等设置变化时全部重新处理
+    每个分片单独输出为 name.00000.txt (binary格式为 name.00000.bin), 写完后原子替换
+    在文件末尾追加新数据时, 之前的分片不变, 只处理末尾的分片
+    所有分片共用一个进程池; 去重时共用一个LSH索引, 分片的哈希串联之前所有分片, 前面的分片变化时后面的分片重新去重
+    每个分片的签名保存在 .signatures 文件夹中; 跳过的分片只在后面有分片需要处理、并且落在索引窗口内时
+    才读取签名加入索引, 没有变化的输入不计算任何签名
+    :param name: 输出文件名前缀, 如 processed_news
+    :param lines: 可迭代的原始文本
+    :param wiki:
+    :param out_dir:
+    :param workers:
+    :param shard_size: 每个分片的行数, 改变后所有分片都会重新处理
+    :param binary:
+    :param dedup: 在整个输入范围内去掉近似重复的文本
+    :param segmenter:
+    :return: (处理的分片数, 跳过的分片数)
+    """
+    manifest_path = os.path.join(out_dir, os.path.basename(PREPROCESS_MANIFEST_PATH))
+    manifest = load_manifest(manifest_path)
+    settings = {'wiki': wiki, 'shard_size': shard_size, 'binary': binary, 'dedup': dedup, 'segmenter': segmenter,
+                'stopwords': lexicons.get(DEFAULT_STOPWORDS_PATH).version}
+    if dedup:
+        settings['dedup_window'] = PREPROCESS_DEDUP_WINDOW
+        settings['dedup_threshold'] = PREPROCESS_DEDUP_THRESHOLD
+    if os.path.exists(os.path.join(out_dir, corpus_name(name, binary))):
+        print('Found {}, remove it to avoid training on the same data twice'.format(corpus_name(name, binary)))
+    processed = skipped = 0
+    current = set()
+    deduplicator = new_deduplicator() if dedup else None
+    pending = deque()  # 跳过的、签名还没有加入索引的分片 (签名文件, 行数)
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    digest = ''
+    try:
+        for index, shard in enumerate(iter_chunks(lines, shard_size)):
+            out_name = corpus_name('{}.{:05d}'.format(name, index), binary)
+            current.add(out_name)
+            digest = shard_hash(shard, digest if dedup else '')
+            entry = manifest['shards'].get(out_name)
+            if entry and entry['hash'] == digest and entry['settings'] == settings \
+                    and os.path.exists(os.path.join(out_dir, out_name)):
+                if deduplicator is not None:
+                    sig_file = signature_path(out_dir, out_name)
+                    if not os.path.exists(sig_file):  # 旧版本输出的分片没有签名, 补算一次
+                        os.makedirs(os.path.dirname(sig_file), exist_ok=True)
+                        save_signatures(sig_file, [sig for _, sigs in iter_signatures(
+                            shard, deduplicator.num_perm, workers, pool=pool) for sig in sigs],
+                                        deduplicator.num_perm)
+                    pending.append((sig_file, len(shard)))
+                    # 索引只保留最近window篇, 更早的分片不会影响后面的分片
+                    while len(pending) > 1 and sum(n for _, n in pending) - pending[0][1] >= deduplicator.window:
+                        pending.popleft()
+                skipped += 1
+                continue
+            signatures = None
+            if deduplicator is not None:
+                while pending:
+                    for sig in load_signatures(pending.popleft()[0]):
+                        deduplicator.is_duplicate(sig)
+                signatures = []
+            n = process_corpus(shard, os.path.join(out_dir, out_name), wiki=wiki, workers=workers,
+                               segmenter=segmenter, binary=binary, dedup=dedup, deduplicator=deduplicator,
+                               pool=pool, signatures=signatures)
+            if signatures is not None:
+                os.makedirs(os.path.dirname(signature_path(out_dir, out_name)), exist_ok=True)
+                save_signatures(signature_path(out_dir, out_name), signatures, deduplicator.num_perm)
+            manifest['shards'][out_name] = {'name': name, 'hash': digest, 'lines': len(shard), 'kept': n,
+                                            'settings': settings, 'updated': time.time()}
+            save_manifest(manifest, manifest_path)  # 每个分片完成后记录, 中断后已完成的分片不再处理
+            processed += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if deduplicator is not None:
+        deduplicator.report(name)
+    # 输入变短或设置改变后不再对应任何输入的旧分片
+    stale = [k for k, v in manifest['shards'].items() if v['name'] == name and k not in current]
+    for out_name in stale:
+        remove_output(os.path.join(out_dir, out_name))
+        remove_output(signature_path(out_dir, out_name))
+        del manifest['shards'][out_name]
+    if stale:
+        save_manifest(manifest, manifest_path)
+    print('{}: processed {} shards, skipped {} unchanged, removed {} stale'.format(name, processed, skipped, len(stale)))
+    return processed, skipped
+
+
 if __name__ == '__main__':
-    train_data_from_news(data_path=NEWS_DATA_PATH,
-                         out_file=PROCESSED_DATA_PATH + 'processed_news.txt')
-    print('finish extracting train data from news')
-    train_data_from_wiki(wiki_path=WIKI_DATA_PATH,
-                         out_file=PROCESSED_DATA_PATH + 'processed_wiki.txt')
-    print('finish extracting train data from wiki dump')
+    from apps.config import WIKI_DUMP_PATH, WIKI_INDEX_PATH
+    if os.path.exists(NEWS_DATA_PATH):
+        update_train_data('processed_news', iter_news_content(NEWS_DATA_PATH), dedup=PREPROCESS_DEDUP)
+        print('finish extracting train data from news')
+    else:
+        print(NEWS_DATA_PATH, ' does not exist')
+    # 优先直接读取multistream dump, 没有时使用已抽取的wiki_00; 两者都输出为 processed_wiki 分片
+    if os.path.exists(WIKI_DUMP_PATH):
+        from apps.utils.wiki_dump import iter_dump_paragraphs
+        update_train_data('processed_wiki', iter_dump_paragraphs(WIKI_DUMP_PATH, WIKI_INDEX_PATH))
+        print('finish extracting train data from wiki dump')
+    elif os.path.exists(WIKI_DATA_PATH):
+        with open(WIKI_DATA_PATH, 'r', encoding='utf-8') as f:
+            update_train_data('processed_wiki', f, wiki=True)
+        print('finish extracting train data from', WIKI_DATA_PATH)
+    else:
+        print('Not Found {} or {}'.format(WIKI_DUMP_PATH, WIKI_DATA_PATH))
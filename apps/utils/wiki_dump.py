@@ -0,0 +1,172 @@
+# coding = utf-8
+"""
+直接读取 zhwiki multistream .bz2 dump
+multistream 文件由许多独立的bz2流拼接而成, 每个流约100个页面,
+索引文件的每一行是 "流的字节偏移:页面id:标题", 因此各个流可以在不同进程中并行解压
+产出的正文段落交给 update_train_data 按分片增量预处理, 输出 processed_wiki.00000.txt 等
+"""
+import bz2
+import io
+import os
+import re
+import xml.etree.ElementTree as ET
+
+from apps.utils.preprocessing import bounded_imap
+from apps.config import WIKI_DUMP_PATH, WIKI_INDEX_PATH, PREPROCESS_WORKERS
+
+RE_COMMENT = re.compile(r'<!--.*?-->', re.S)
+RE_REF = re.compile(r'<ref[^>]*/>|<ref[^>]*>.*?</ref>', re.S | re.I)
+RE_TEMPLATE = re.compile(r'\{\{[^{}]*\}\}')
+RE_TABLE = re.compile(r'\{\|[^{}]*?\|\}', re.S)
+RE_FILE_LINK = re.compile(r'\[\[(?:File|Image|文件|檔案|图像|圖像|Category|分类|分類):[^\[\]]*(?:\[\[[^\[\]]*\]\][^\[\]]*)*\]\]', re.I)
+RE_LINK = re.compile(r'\[\[(?:[^\[\]|]*\|)?([^\[\]]*)\]\]')
+RE_EXT_LINK = re.compile(r'\[(?:https?|ftp)://[^\s\]]+\s*([^\]]*)\]')
+RE_HTML = re.compile(r'<[^>]+>')
+RE_QUOTES = re.compile(r"'{2,}")
+RE_HEADING = re.compile(r'^=+\s*(.*?)\s*=+$', re.M)
+RE_LANG = re.compile(r'-\{(?:[^{}|]*\|)?([^{}]*)\}-')
+
+
+def _lang_variant(match):
+    """
+    -{zh-hans:简;zh-hant:繁}- 取简体写法, -{原文}- 取原文
+    """
+    body = match.group(1)
+    variants = dict(v.split(':', 1) for v in body.split(';') if ':' in v)
+    if not variants:
+        return body
+    for lang in ('zh-hans', 'zh-cn', 'zh'):
+        if lang in variants:
+            return variants[lang]
+    return next(iter(variants.values()))
+
+
+def strip_markup(text):
+    """
+    去掉wiki标记, 只保留正文
+    :param text: wikitext
+    :return: 正文段落列表
+    """
+    text = RE_COMMENT.sub('', text)
+    text = RE_REF.sub('', text)
+    text = RE_LANG.sub(_lang_variant, text)
+    # 模板和表格可以嵌套, 由内向外反复去除
+    for pattern in (RE_TEMPLATE, RE_TABLE):
+        n = 1
+        while n:
+            text, n = pattern.subn('', text)
+    text = RE_FILE_LINK.sub('', text)
+    text = RE_LINK.sub(r'\1', text)
+    text = RE_EXT_LINK.sub(r'\1', text)
+    text = RE_HTML.sub('', text)
+    text = RE_QUOTES.sub('', text)
+    text = RE_HEADING.sub(r'\1', text)
+    paragraphs = []
+    for line in text.split('\n'):
+        line = line.strip().lstrip('*#:;').strip()
+        if line:
+            paragraphs.append(line)
+    return paragraphs
+
+
+def iter_pages(fileobj):
+    """
+    增量解析页面XML, 只产出条目(ns=0)的正文, 跳过重定向
+    :param fileobj: 二进制文件对象
+    :return: (标题, wikitext)
+    """
+    title = ns = text = None
+    redirect = False
+    root = None
+    for event, elem in ET.iterparse(fileobj, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            continue
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if tag == 'title':
+            title = elem.text
+        elif tag == 'ns':
+            ns = elem.text
+        elif tag == 'redirect':
+            redirect = True
+        elif tag == 'text':
+            text = elem.text
+        elif tag == 'page':
+            if ns == '0' and not redirect and text:
+                yield title, text
+            title = ns = text = None
+            redirect = False
+            # 根元素仍引用已清空的page, 一并清掉, 内存不随dump大小增长
+            root.clear()
+
+
+def read_stream_offsets(index_path):
+    """
+    从multistream索引中读出每个bz2流的起始偏移
+    :param index_path:
+    :return: 递增的偏移列表
+    """
+    offsets = set()
+    with bz2.open(index_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            offset, _ = line.split(':', 1)
+            offsets.add(int(offset))
+    return sorted(offsets)
+
+
+def iter_blocks(dump_path, offsets):
+    """
+    相邻偏移之间就是一个完整的bz2流, 最后一个流到文件末尾
+    :return: (dump_path, start, end)
+    """
+    ends = offsets[1:] + [os.path.getsize(dump_path)]
+    for start, end in zip(offsets, ends):
+        yield dump_path, start, end
+
+
+def decompress_block(block):
+    """
+    解压一个流并解析其中的页面, 在子进程中执行
+    :param block: (dump_path, start, end)
+    :return: 正文段落列表
+    """
+    dump_path, start, end = block
+    with open(dump_path, 'rb') as f:
+        f.seek(start)
+        data = bz2.decompress(f.read(end - start))
+    # 流里只有若干<page>, 没有根节点; 尾部的流还带着</mediawiki>
+    data = data.replace(b'</mediawiki>', b'')
+    if b'<page>' not in data:
+        return []
+    paragraphs = []
+    for _, text in iter_pages(io.BytesIO(b'<pages>' + data + b'</pages>')):
+        paragraphs.extend(strip_markup(text))
+    return paragraphs
+
+
+def iter_dump_paragraphs(dump_path, index_path=None, workers=PREPROCESS_WORKERS):
+    """
+    逐段产出dump中的正文; 有索引时并行解压, 否则顺序读取整个dump
+    :param dump_path:
+    :param index_path:
+    :param workers:
+    :return:
+    """
+    if index_path and os.path.exists(index_path):
+        blocks = iter_blocks(dump_path, read_stream_offsets(index_path))
+        for _, paragraphs in bounded_imap(decompress_block, blocks, workers):
+            yield from paragraphs
+    else:
+        with bz2.open(dump_path, 'rb') as f:
+            for _, text in iter_pages(f):
+                yield from strip_markup(text)
+
+
+if __name__ == '__main__':
+    from apps.utils.preprocessing import update_train_data
+    if os.path.exists(WIKI_DUMP_PATH):
+        update_train_data('processed_wiki', iter_dump_paragraphs(WIKI_DUMP_PATH, WIKI_INDEX_PATH))
+        print('finish extracting train data from wiki dump')
+    else:
+        print('Not Found {}'.format(WIKI_DUMP_PATH))
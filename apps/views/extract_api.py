@@ -0,0 +1,74 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: extract_api.py
+@time: 2019/10/20 16:40
+"""
+import json
+
+from flask import request, current_app, jsonify
+from flask import Response, stream_with_context
+
+from apps.views import nlp_bp
+from apps.nlp.parse_news import SpeechExtractor
+from apps.nlp.ltp_pool import LTPPoolExhausted
+from apps.config import SYNONYMS_PATH
+
+
+def parse_documents(payload):
+    """
+    解析请求中的新闻列表, 支持 ["新闻", ...] 或 [{"id": ..., "text": "新闻"}, ...]
+    :param payload:
+    :return: (ids, texts)
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('documents'), list):
+        raise ValueError('request body must be a JSON object with a "documents" list')
+    ids, texts = [], []
+    for i, doc in enumerate(payload['documents']):
+        if isinstance(doc, str):
+            ids.append(i)
+            texts.append(doc)
+        elif isinstance(doc, dict) and isinstance(doc.get('text'), str):
+            ids.append(doc.get('id', i))
+            texts.append(doc['text'])
+        else:
+            raise ValueError('document {} must be a string or an object with a "text" string'.format(i))
+    return ids, texts
+
+
+@nlp_bp.route('/api/extract/', endpoint='batch_extractor', methods=['POST'])
+def batch_extractor():
+    """
+    批量抽取言论, 以NDJSON逐篇返回结果
+    """
+    try:
+        ids, texts = parse_documents(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(texts) > current_app.config['API_MAX_DOCUMENTS']:
+        return jsonify({'error': 'at most {} documents per request'.format(current_app.config['API_MAX_DOCUMENTS'])}), 413
+
+    pool = current_app.extensions['ltp_pool']
+    try:
+        manager = pool.checkout()
+    except LTPPoolExhausted as e:
+        return jsonify({'error': str(e)}), 503
+    batch_size = current_app.config['API_BATCH_SIZE']
+    tfidf_model = current_app.extensions['tfidf_model']
+    cache = current_app.extensions['extraction_cache']
+    segmenter = current_app.extensions['segmenter']
+
+    def generate():
+        extractor = SpeechExtractor(None, SYNONYMS_PATH, manager, tfidf_model, cache, segmenter)
+        for i, results in extractor.process_batch(texts, batch_size=batch_size):
+            line = {'id': ids[i],
+                    'results': [{'person': r[0], 'say': r[1], 'content': r[2]} for r in results]}
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # 响应结束(包括客户端提前断开)时归还模型
+    response.call_on_close(lambda: pool.checkin(manager))
+    return response
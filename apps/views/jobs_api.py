@@ -0,0 +1,83 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: jobs_api.py
+@time: 2019/10/23 11:05
+"""
+from flask import request, current_app, jsonify, url_for
+
+from apps.views import nlp_bp
+from apps.nlp.jobs import JobQueueFull, JobWorkersFailed
+
+
+def get_jobs():
+    return current_app.extensions.get('jobs')
+
+
+def not_enabled():
+    return jsonify({'error': 'async jobs are disabled (JOB_WORKERS=0)'}), 503
+
+
+@nlp_bp.route('/api/jobs/', endpoint='submit_job', methods=['POST'])
+def submit_job():
+    """
+    提交一篇长文本, 立即返回任务id, 用GET /api/jobs/<id> 查询结果
+    请求体: {"text": "新闻全文"}
+    """
+    jobs = get_jobs()
+    if jobs is None:
+        return not_enabled()
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('text'), str) or not payload['text'].strip():
+        return jsonify({'error': 'request body must be a JSON object with a non-empty "text" string'}), 400
+    max_chars = current_app.config['JOB_MAX_CHARS']
+    if len(payload['text']) > max_chars:
+        return jsonify({'error': 'text is longer than {} characters'.format(max_chars)}), 413
+    try:
+        job = jobs.submit(payload['text'])
+    except JobQueueFull as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    except JobWorkersFailed as e:
+        return jsonify({'error': str(e)}), 503
+    location = url_for('nlp.job_status', job_id=job.id)
+    response = jsonify({'id': job.id, 'status': job.status, 'url': location})
+    response.headers['Location'] = location
+    return response, 202
+
+
+@nlp_bp.route('/api/jobs/<job_id>', endpoint='job_status', methods=['GET'])
+def job_status(job_id):
+    jobs = get_jobs()
+    if jobs is None:
+        return not_enabled()
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'job {} not found or expired'.format(job_id)}), 404
+    return jsonify(job.to_dict())
+
+
+@nlp_bp.route('/api/jobs/<job_id>', endpoint='cancel_job', methods=['DELETE'])
+def cancel_job(job_id):
+    """
+    取消任务, 运行中的任务在处理下一句之前停止, 状态可能稍后才变为cancelled
+    """
+    jobs = get_jobs()
+    if jobs is None:
+        return not_enabled()
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'job {} not found or expired'.format(job_id)}), 404
+    return jsonify(job.to_dict()), 202
+
+
+@nlp_bp.route('/api/jobs/stats/', endpoint='job_stats', methods=['GET'])
+def job_stats():
+    jobs = get_jobs()
+    if jobs is None:
+        return not_enabled()
+    return jsonify(jobs.stats())
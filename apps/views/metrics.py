@@ -0,0 +1,45 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: metrics.py
+@time: 2019/10/24 11:20
+"""
+from flask import current_app, jsonify, Response
+
+from apps.views import nlp_bp
+from apps.nlp.parse_news import pipeline_stats
+from apps.utils.metrics import metrics
+
+
+def collect_gauges():
+    """
+    模型池、缓存和各阶段跳过的句子数
+    :return:
+    """
+    gauges = {}
+    pool = current_app.extensions.get('ltp_pool')
+    if pool is not None:
+        gauges['nlp_ltp_pool_size'] = {None: pool.size}
+        gauges['nlp_ltp_pool_available'] = {None: pool.available}
+    cache = current_app.extensions.get('extraction_cache')
+    if cache is not None:
+        for level, stats in cache.stats().items():
+            for field in ('size', 'hits', 'misses', 'evictions'):
+                gauges.setdefault('nlp_cache_' + field, {})['level="{}"'.format(level)] = stats[field]
+    counts = pipeline_stats.snapshot()
+    gauges['nlp_pipeline_sentences'] = {'stage="{}"'.format(k): v for k, v in counts.items()
+                                        if k != 'parse_skip_rate'}
+    return gauges
+
+
+@nlp_bp.route('/metrics', endpoint='metrics')
+def metrics_view():
+    return Response(metrics.render(collect_gauges()), mimetype='text/plain; version=0.0.4')
+
+
+@nlp_bp.route('/metrics/traces', endpoint='metrics_traces')
+def traces_view():
+    return jsonify([trace.to_dict() for trace in list(metrics.traces)])
@@ -7,14 +7,15 @@
 @file: news_auto_extract.py
 @time: 2019/10/7 19:19
 """
-from flask import request, url_for
+from flask import request, url_for, current_app, jsonify
 from flask import render_template, redirect
 
 from apps.forms.news_extractor import NewsExtractorForm
 
 from apps.views import nlp_bp
-from apps.nlp.parse_news import SpeechExtractor, LTPManager
-from apps.config import SYNONYMS_PATH, LTP_MODEL_PATH
+from apps.nlp.parse_news import SpeechExtractor, pipeline_stats
+from apps.nlp.ltp_pool import LTPPoolExhausted
+from apps.config import SYNONYMS_PATH
 
 
 @nlp_bp.route('/')
@@ -26,10 +27,16 @@ def nlp_projects():
 def auto_extractor():
     news_form = NewsExtractorForm(request.form)
     if request.method == 'POST' and news_form.validate():
-        LTPM = LTPManager(LTP_MODEL_PATH)
         data = news_form.news.data
-        npa = SpeechExtractor(data, SYNONYMS_PATH, LTPM)
-        results = npa()  # [[who,say,content],[...],...]
+        try:
+            with current_app.extensions['ltp_pool'].acquire() as LTPM:
+                npa = SpeechExtractor(data, SYNONYMS_PATH, LTPM,
+                                      current_app.extensions['tfidf_model'],
+                                      current_app.extensions['extraction_cache'],
+                                      current_app.extensions['segmenter'])
+                results = npa.process()  # [[who,say,content],[...],...]
+        except LTPPoolExhausted:
+            return render_template('news_extractor.html', forms=news_form, busy=True), 503
         if results and isinstance(results, list):
             result = [{'person': result[0], 'say': result[1], 'content': result[2], 'news': data} for result in results]
             return render_template('extract.html', forms=result)
@@ -39,6 +46,29 @@ def auto_extractor():
     return render_template('news_extractor.html', forms=news_form)
 
 
+@nlp_bp.route('/ready/', endpoint='readiness')
+def readiness():
+    pool = current_app.extensions['ltp_pool']
+    status = {'ready': pool.ready, 'pool_size': pool.size, 'available': pool.available}
+    jobs = current_app.extensions.get('jobs')
+    if jobs is not None:
+        # 任务线程加载模型失败时实例不可用, 否则提交的任务永远不会被处理
+        status['jobs'] = {'workers': jobs.workers, 'loaded': jobs.loaded, 'failed': jobs.failed,
+                          'error': jobs.load_error}
+        status['ready'] = status['ready'] and not jobs.failed
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+@nlp_bp.route('/cache/stats/', endpoint='cache_stats')
+def cache_stats():
+    return jsonify(current_app.extensions['extraction_cache'].stats())
+
+
+@nlp_bp.route('/pipeline/stats/', endpoint='pipeline_stats')
+def pipeline_stats_view():
+    return jsonify(pipeline_stats.snapshot())
+
+
 # @nlp_bp.route('show_res', endpoint='show_result')
 # def show_result(results):
 #     return render_template('extract.html', forms=results)
@@ -0,0 +1,38 @@
+# encoding: utf-8
+
+"""
+@author: Henry
+@site:
+@software: PyCharm
+@file: quotes_api.py
+@time: 2019/10/26 17:05
+"""
+from flask import request, current_app, jsonify
+
+from apps.views import nlp_bp
+
+MAX_LIMIT = 200
+
+
+@nlp_bp.route('/api/quotes/', endpoint='quotes', methods=['GET'])
+def quotes():
+    """
+    查询言论库: ?speaker=说话人&verb=言论动词&q=内容中的词&limit=20&before=上一页最后的id
+    """
+    speaker = request.args.get('speaker', '').strip()
+    verb = request.args.get('verb', '').strip()
+    text = request.args.get('q', '').strip()
+    if not (speaker or verb or text):
+        return jsonify({'error': 'at least one of "speaker", "verb" or "q" is required'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+        before = request.args.get('before')
+        before = int(before) if before else None
+    except ValueError:
+        return jsonify({'error': '"limit" and "before" must be integers'}), 400
+    if not 1 <= limit <= MAX_LIMIT:
+        return jsonify({'error': '"limit" must be between 1 and {}'.format(MAX_LIMIT)}), 400
+    results = current_app.extensions['quote_store'].query(speaker=speaker, verb=verb, text=text,
+                                                          limit=limit, before=before)
+    next_before = results[-1]['id'] if results and len(results) == limit else None
+    return jsonify({'quotes': results, 'before': next_before})
@@ -0,0 +1,3 @@
+"""
+离线基准测试, 不需要LTP模型文件和词向量
+"""
@@ -0,0 +1,182 @@
+"""
+抽取、预处理、相近词扩展的基准测试, 全部离线运行
+结果写入JSON文件, 并与保存的基线比较: 每项重复运行若干次取各指标的中位数,
+吞吐下降超过容忍度时以非零状态退出; 单次调用只有几毫秒, p99波动大, 只打印警告
+用法:
+    python -m benchmarks.run                      # 运行并与基线比较
+    python -m benchmarks.run --update-baseline    # 运行并把结果保存为新基线
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from apps.nlp.parse_news import SpeechExtractor
+from apps.nlp.get_synonyms import get_related_word
+from apps.utils.preprocessing import clean_chunk, iter_chunks
+from benchmarks.fake_ltp import FakeLTPManager
+from benchmarks.synthetic import generate_documents, SPEECH_VERBS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BASE_DIR, 'baseline.json')
+RESULTS_PATH = os.path.join(BASE_DIR, 'results.json')
+
+
+def summarize(latencies, items, unit):
+    """
+    :param latencies: 每次调用的耗时(秒)
+    :param items: 处理的条数
+    :param unit: 吞吐的单位
+    :return:
+    """
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {'throughput': items / sum(latencies), 'unit': unit, 'calls': n,
+            'p50_ms': latencies[int(0.50 * (n - 1))] * 1000,
+            'p99_ms': latencies[int(0.99 * (n - 1))] * 1000}
+
+
+def timed(func, inputs):
+    latencies = []
+    for item in inputs:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_extraction(n_docs):
+    documents = generate_documents(n_docs, seed=1)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', delete=False) as f:
+        f.write('\n'.join(SPEECH_VERBS))
+    try:
+        extractor = SpeechExtractor(None, f.name, FakeLTPManager())
+
+        def run(doc):
+            extractor.news = doc
+            extractor.process()
+
+        run(documents[0])  # 预热
+        return summarize(timed(run, documents), n_docs, 'docs/s')
+    finally:
+        os.remove(f.name)
+
+
+def bench_preprocessing(n_lines, chunk_size=200):
+    lines = [s for doc in generate_documents(n_lines // 12 + 1, seed=2) for s in doc.split('。')][:n_lines]
+    chunks = list(iter_chunks(lines, chunk_size))
+    clean_chunk(chunks[0])  # 预热, 加载jieba词典
+    return summarize(timed(clean_chunk, chunks), len(lines), 'lines/s')
+
+
+class FakeKeyedVectors(object):
+    """
+    随机词向量, 具有 KeyedVectors 中相近词扩展用到的属性
+    """
+
+    def __init__(self, n_words, dim, seed=0):
+        rng = np.random.RandomState(seed)
+        self.index_to_key = SPEECH_VERBS + ['w{}'.format(i) for i in range(n_words - len(SPEECH_VERBS))]
+        self.key_to_index = {w: i for i, w in enumerate(self.index_to_key)}
+        self.vectors = rng.standard_normal((n_words, dim)).astype(np.float32)
+
+
+def bench_synonyms(n_words, dim, repeat):
+    model = FakeKeyedVectors(n_words, dim)
+    get_related_word(SPEECH_VERBS, model, size=10)  # 预热, 计算范数
+    return summarize(timed(lambda _: get_related_word(SPEECH_VERBS, model, size=500), range(repeat)),
+                     repeat, 'expansions/s')
+
+
+def median_of(bench, repeats):
+    """
+    重复运行一项基准测试, 各指标分别取中位数
+    :param bench: 无参数的函数, 返回summarize的结果
+    :param repeats:
+    :return:
+    """
+    runs = [bench() for _ in range(repeats)]
+    result = dict(runs[0])
+    for key in ('throughput', 'p50_ms', 'p99_ms'):
+        result[key] = float(np.median([r[key] for r in runs]))
+    result['repeats'] = repeats
+    return result
+
+
+def run_all(quick=False, repeats=5):
+    scale = 0.2 if quick else 1.0
+    return {
+        'extraction': median_of(lambda: bench_extraction(int(500 * scale)), repeats),
+        'preprocessing': median_of(lambda: bench_preprocessing(int(20000 * scale)), repeats),
+        'synonyms': median_of(lambda: bench_synonyms(int(100000 * scale), 128, max(3, int(10 * scale))), repeats),
+    }
+
+
+def compare(results, baseline, tolerance, p99_tolerance=1.0):
+    """
+    :param tolerance: 吞吐允许的相对下降
+    :param p99_tolerance: p99允许的相对上升, 超过时只警告
+    :return: (回退的项目列表, 警告列表)
+    """
+    regressions, warnings = [], []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append('{}: throughput {:.1f} < baseline {:.1f} {}'.format(
+                name, current['throughput'], base['throughput'], current['unit']))
+        if current['p99_ms'] > base['p99_ms'] * (1 + p99_tolerance):
+            warnings.append('{}: p99 {:.2f}ms > baseline {:.2f}ms'.format(name, current['p99_ms'], base['p99_ms']))
+    return regressions, warnings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='吞吐允许的相对回退, 默认25%%')
+    parser.add_argument('--p99-tolerance', type=float, default=1.0, help='p99允许的相对上升, 超过时只警告, 默认100%%')
+    parser.add_argument('--repeats', type=int, default=5, help='每项重复次数, 取中位数')
+    parser.add_argument('--quick', action='store_true', help='缩小数据规模, 用于快速检查')
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = run_all(args.quick, args.repeats)
+    for name, r in results.items():
+        print('{:<14} {:>10.1f} {:<13} p50 {:>8.2f}ms  p99 {:>8.2f}ms'.format(
+            name, r['throughput'], r['unit'], r['p50_ms'], r['p99_ms']))
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'quick': args.quick,
+              'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print('baseline saved to', args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('no baseline at', args.baseline)
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('quick') != args.quick:
+        print('baseline was recorded with quick={}, skip comparison'.format(baseline.get('quick')))
+        return 0
+    regressions, warnings = compare(results, baseline['results'], args.tolerance, args.p99_tolerance)
+    for line in warnings:
+        print('WARNING', line)
+    for line in regressions:
+        print('REGRESSION', line)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
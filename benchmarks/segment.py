@@ -0,0 +1,51 @@
+"""
+分词后端的吞吐对比: jieba单进程、jieba多进程、LTP
+默认用假LTP后端(只能说明调用开销), 指定 --ltp-dir 时加载真实的LTP分词模型
+用法:
+    python -m benchmarks.segment
+    python -m benchmarks.segment --workers 4 --ltp-dir apps/ltp/
+"""
+import argparse
+import os
+import sys
+
+from apps.nlp.segment import JiebaSegmenter, LTPSegmenter
+from apps.utils.preprocessing import normalize_line
+from benchmarks.fake_ltp import FakeLTPManager
+from benchmarks.run import summarize, timed
+from benchmarks.synthetic import generate_documents
+
+
+def bench_segmenter(segmenter, texts, batch_size):
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    segmenter.segment(batches[0])  # 预热, 加载词典/创建进程池
+    return summarize(timed(segmenter.segment, batches), len(texts), 'sentences/s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sentences', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=2000, help='每次segment调用的句子数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='jieba多进程模式的进程数')
+    parser.add_argument('--ltp-dir', default=None, help='LTP模型目录, 不指定时使用假LTP后端')
+    args = parser.parse_args(argv)
+
+    sentences = [s for doc in generate_documents(args.sentences // 12 + 1, seed=4) for s in doc.split('。')]
+    texts = [t for t in (normalize_line(s) for s in sentences[:args.sentences]) if t]
+
+    backends = [('jieba', JiebaSegmenter()),
+                ('jieba x{}'.format(args.workers), JiebaSegmenter(workers=args.workers)),
+                ('ltp' if args.ltp_dir else 'ltp (fake)',
+                 LTPSegmenter(data_dir=args.ltp_dir) if args.ltp_dir else LTPSegmenter(FakeLTPManager()))]
+    for name, segmenter in backends:
+        try:
+            r = bench_segmenter(segmenter, texts, args.batch_size)
+        finally:
+            segmenter.close()
+        print('{:<14} {:>10.1f} {:<13} p50 {:>8.2f}ms  p99 {:>8.2f}ms'.format(
+            name, r['throughput'], r['unit'], r['p50_ms'], r['p99_ms']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+冷启动基准: 在全新的子进程中测量 导入 -> create_app() -> 第一个抽取请求 的耗时,
+超过预算时以非零状态退出, 可以放在部署流水线里防止启动时间回退
+第一个请求是对一篇短新闻的 POST /api/extract/, 分词表、tf-idf等首次使用时才加载的开销都计算在内;
+LTP模型文件不存在时使用 benchmarks/fake_ltp.py 的假后端
+用法: python -m benchmarks.startup [--budget 秒] [--runs 次数]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from apps.config import STARTUP_BUDGET_SECONDS
+
+CHILD = r'''
+import json, os, random, time
+t0 = time.perf_counter()
+from apps import create_app
+from apps.config import LTP_MODEL_PATH
+t1 = time.perf_counter()
+# 选择后端和生成新闻不计入耗时
+from benchmarks.synthetic import generate_document
+config, backend = {}, 'ltp'
+if not os.path.exists(os.path.join(LTP_MODEL_PATH, 'cws.model')):
+    from benchmarks.fake_ltp import FakeLTPManager
+    config, backend = {'LTP_MANAGER_FACTORY': FakeLTPManager}, 'fake'
+document = generate_document(random.Random(0), sentences=6, speech_ratio=0.5)
+t1b = time.perf_counter()
+app = create_app(config)
+t2 = time.perf_counter()
+response = app.test_client().post('/api/extract/', json={'documents': [document]})
+lines = response.get_data(as_text=True).splitlines()  # 读完流式响应, 抽取才真正执行
+t3 = time.perf_counter()
+quotes = sum(len(json.loads(line)['results']) for line in lines) if response.status_code == 200 else 0
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1b, 'first_request': t3 - t2,
+                  'total': (t1 - t0) + (t3 - t1b), 'status': response.status_code,
+                  'quotes': quotes, 'backend': backend}))
+'''
+
+
+def measure():
+    output = subprocess.check_output([sys.executable, '-c', CHILD])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    runs = [measure() for _ in range(args.runs)]
+    for r in runs:
+        print('import {import:.3f}s  create_app {create_app:.3f}s  first extraction {first_request:.3f}s  '
+              'total {total:.3f}s  status {status}  quotes {quotes}  backend {backend}'.format(**r))
+    if any(r['status'] != 200 for r in runs):
+        print('first extraction request failed')
+        return 1
+    best = min(r['total'] for r in runs)
+    print('best total {:.3f}s, budget {:.3f}s'.format(best, args.budget))
+    if best > args.budget:
+        print('startup time over budget')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
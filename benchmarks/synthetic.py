@@ -0,0 +1,58 @@
+"""
+合成中文新闻, 结构与真实新闻相近: 大部分是叙述句, 少部分是 "某人说，……。" 形式的言论句
+固定随机种子时输出完全确定
+"""
+import random
+
+PERSONS = ['周世耀', '许振隆', '郭紫晴', '赵颖贤', '蒋靖轩', '李明华', '王建国', '陈晓东', '张丽娟', '刘德文']
+ORGS = ['香港升旗队总会', '新华社', '外交部', '国家统计局', '教育局', '世界卫生组织']
+PLACES = ['香港', '北京', '上海', '元朗', '深圳', '广州']
+SPEECH_VERBS = ['说', '表示', '认为', '指出', '强调', '称', '透露', '介绍', '坦言', '回应']
+SUBJECTS = ['活动', '会议', '市场', '经济', '学校', '社会', '市民', '政府', '企业', '年轻人']
+PREDICATES = ['发展迅速', '取得了重要进展', '受到广泛关注', '面临新的挑战', '得到大力支持',
+              '逐步恢复平静', '需要共同努力', '气氛十分热烈', '意义重大', '正在有序推进']
+CONNECTIVES = ['同时', '此外', '但是', '因此', '目前', '近日', '今年以来', '据了解']
+
+
+def clause(rng):
+    return '{}{}{}'.format(rng.choice(PLACES), rng.choice(SUBJECTS), rng.choice(PREDICATES))
+
+
+def narrative(rng):
+    parts = [clause(rng) for _ in range(rng.randint(1, 3))]
+    return '{}，{}。'.format(rng.choice(CONNECTIVES), '，'.join(parts))
+
+
+def speech(rng):
+    speaker = rng.choice(PERSONS)
+    if rng.random() < 0.3:
+        speaker = rng.choice(ORGS) + speaker
+    parts = [clause(rng) for _ in range(rng.randint(1, 3))]
+    return '{}{}，{}。'.format(speaker, rng.choice(SPEECH_VERBS), '，'.join(parts))
+
+
+def generate_document(rng, sentences=12, speech_ratio=0.25):
+    return ''.join(speech(rng) if rng.random() < speech_ratio else narrative(rng) for _ in range(sentences))
+
+
+def generate_documents(n, seed=0, sentences=12, speech_ratio=0.25):
+    """
+    :param n: 篇数
+    :param seed:
+    :param sentences: 每篇的句子数
+    :param speech_ratio: 言论句的比例
+    :return:
+    """
+    rng = random.Random(seed)
+    return [generate_document(rng, sentences, speech_ratio) for _ in range(n)]
+
+
+def vocabulary():
+    """
+    合成文本用到的全部词, 供假分词器使用
+    """
+    words = set(PERSONS + ORGS + PLACES + SPEECH_VERBS + SUBJECTS + CONNECTIVES)
+    for predicate in PREDICATES:
+        words.add(predicate[:2])
+        words.add(predicate[2:])
+    return words
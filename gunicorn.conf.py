@@ -0,0 +1,18 @@
+# gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+
+bind = '0.0.0.0:5000'
+workers = multiprocessing.cpu_count()
+
+
+def on_starting(server):
+    # 需要时(PRELOAD_WORD_VECTORS=1)主进程在fork之前加载词表并预热向量文件, 所有worker共享同一份内存映射
+    from apps.config import PRELOAD_WORD_VECTORS, WORD2VEC_MODEL_PATH
+    if not PRELOAD_WORD_VECTORS:
+        return
+    if not os.path.exists(WORD2VEC_MODEL_PATH):
+        server.log.warning('%s does not exist, skip preloading word vectors', WORD2VEC_MODEL_PATH)
+        return
+    from apps.nlp.get_synonyms import preload_word_vectors
+    preload_word_vectors()